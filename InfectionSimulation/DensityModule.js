@@ -0,0 +1,36 @@
+var DensityModule = function(canvas_width, canvas_height) {
+	// Create the element
+	// ------------------
+
+	var canvas_tag = `<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`
+	var parent_div_tag = '<div style="height:' + canvas_height + 'px;" class="world-grid-parent"></div>'
+
+	var canvas = $(canvas_tag)[0];
+	var parent = $(parent_div_tag)[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+
+	var context = canvas.getContext("2d");
+	// the image is first drawn at its own resolution here, then scaled onto the visible canvas
+	var buffer = document.createElement("canvas");
+	var buffer_context = buffer.getContext("2d");
+
+	this.render = function(data) {
+		var bytes = atob(data.image);
+		var pixels = new Uint8ClampedArray(bytes.length);
+		for (var i = 0; i < bytes.length; i++)
+			pixels[i] = bytes.charCodeAt(i);
+
+		buffer.width = data.width;
+		buffer.height = data.height;
+		buffer_context.putImageData(new ImageData(pixels, data.width, data.height), 0, 0);
+
+		context.clearRect(0, 0, canvas_width, canvas_height);
+		context.imageSmoothingEnabled = false;
+		context.drawImage(buffer, 0, 0, canvas_width, canvas_height);
+	};
+
+	this.reset = function() {
+		context.clearRect(0, 0, canvas_width, canvas_height);
+	};
+};
@@ -1,14 +1,15 @@
 from __future__ import annotations
 
-from math import sin, cos, pi
+import math
+import numpy as np
 from mesa import Agent
 
 try:
-    from utility import InfectionState, toroidal_distance
+    from utility import InfectionState
     import simulation_parameters as params
 except ImportError:
     from InfectionSimulation import simulation_parameters as params
-    from InfectionSimulation.utility import InfectionState, toroidal_distance
+    from InfectionSimulation.utility import InfectionState
 
 
 class PersonAgent(Agent):
@@ -16,7 +17,7 @@ class PersonAgent(Agent):
     Agent class
     """
 
-    def __init__(self, u_id: int, model, initial_state: InfectionState):
+    def __init__(self, u_id: int, model, initial_state: InfectionState, row: int):
         """
         Parameters
         ----------
@@ -26,10 +27,14 @@ class PersonAgent(Agent):
             Model that created and handles this agent. Must have grid and scheduler (simultaneous)
         initial_state : InfectionState
             Initial infection state of this agent
+        row : int
+            Row of the agent in model.attributes, and in the group parameters of the model
         """
         # call base __init__
         super().__init__(u_id, model)
         # current state of this agent. Check utility.py for possible states
+        # age group, mobility class and their parameters are stored by row in the model
+        self.row = row
         self.state = initial_state
         # how long the agent is infected
         self.infection_duration = 0
@@ -44,6 +49,17 @@ class PersonAgent(Agent):
         # will this agent die this step?
         self.die = False
 
+    @property
+    def state(self) -> InfectionState:
+        return self._state
+
+    @state.setter
+    def state(self, state: InfectionState):
+        # the state is also stored by row in the model, so that the grid can be aggregated without
+        # visiting every agent
+        self._state = state
+        self.model.attributes.states[self.row] = state.value
+
     def simulate_birth(self):
         """
         Simulates individuals giving birth. This occurs with probability as specified in params
@@ -60,10 +76,21 @@ class PersonAgent(Agent):
         if self.random.uniform(0, 1) < self.model.params['population_death_rate'] / 8760:
             self.die = True
 
-    def infect(self):
+    def infect(self, infector: PersonAgent = None, distance: float = math.nan):
         """
         Called when an agent is infected by another agent
-        """
+
+        Parameters
+        ----------
+        infector : PersonAgent, optional
+            The infected agent that spread the infection
+        distance : float, optional
+            Distance between the agents
+        """
+        # only the first infection of a step is traced, since the others don't change anything
+        if self.model.tracer is not None and self.target_state != InfectionState.INF:
+            self.model.tracer.record(self.model.step_count, -1 if infector is None else infector.unique_id,
+                                     self.unique_id, distance)
         self.target_state = InfectionState.INF
         self.model.statistics["total_infections"] += 1
         self.infection_duration = 0
@@ -74,7 +101,7 @@ class PersonAgent(Agent):
         or die, based on mortality_rate
         """
         if self.random.uniform(0, 1) < params.infection_end_chance(self.model.params, self.infection_duration):
-            if self.random.uniform(0, 1) < self.model.params['mortality_rate']:
+            if self.random.uniform(0, 1) < self.model.mortality_rate[self.row]:
                 self.model.dead_agents.append(self)
             else:
                 self.model.statistics["total_recoveries"] += 1
@@ -99,40 +126,36 @@ class PersonAgent(Agent):
         Called on susceptible agents, has a chance for them to get vaccinated
         """
         if self.model.vaccination_started and \
-                self.random.uniform(0, 1) < self.model.params['general_vaccination_rate']:
+                self.random.uniform(0, 1) < self.model.vaccination_rate[self.row]:
             self.target_state = InfectionState.VAC
 
     def spread(self):
         """
         Called on infected agents, to spread infection
         """
-        # iterate through all agents in 3 unit radius neighbourhood
-        for agent in self.model.grid.iter_cell_list_contents(self.model.grid.get_neighborhood(
-                self.pos, moore=True, include_center=True,
-                radius=self.model.params['infection_radius'])):
-            # we can only infect susceptible individuals
-            if agent.state == InfectionState.SUS and self.random.uniform(0, 1) < \
-                    params.infection_chance(self.model.params, toroidal_distance(self.pos, agent.pos,
-                                                                                 self.model.params['grid_width'],
-                                                                                 self.model.params['grid_height'])):
-                agent.infect()
-
-    def move(self):
-        """
-        Moves agent randomly in Von Neumann neighbourhood
-        """
-        distance_to_move = params.movement_distance(self.model.params)
-        angle = self.random.uniform(0, 2 * pi)
-        cell = (self.pos[0] + round(distance_to_move * cos(angle)),
-                self.pos[1] + round(distance_to_move * sin(angle)))
-        # neighbours = self.model.grid.get_neighborhood(self.pos, moore=False)
-        self.model.grid.move_agent(self, cell)
+        x, y = self.pos
+        width, height = self.model.grid.width, self.model.grid.height
+        susceptibility = self.model.susceptibility
+        # susceptible agents in all cells in infection radius, with the precomputed infection chance
+        # we can only infect susceptible individuals
+        contacts = [(agent, chance, distance) for dx, dy, chance, distance in self.model.infection_kernel
+                    for agent in self.model.grid[(x + dx) % width][(y + dy) % height]
+                    if agent.state == InfectionState.SUS]
+        if contacts and self.model.random_infection_chance is not None:
+            # a random infection chance is drawn for every contact, all at once
+            chances = self.model.random_infection_chance(np.array([contact[2] for contact in contacts])).tolist()
+        else:
+            chances = [contact[1] for contact in contacts]
+        for (agent, _, distance), chance in zip(contacts, chances):
+            # scaled by the susceptibility of their group
+            if self.random.uniform(0, 1) < chance * susceptibility[agent.row]:
+                agent.infect(self, distance)
 
     def step(self):
         """
-        Called every agent step, stages changes to be applied
+        Called every agent step, stages changes to be applied. Agents have already been moved by
+        the model
         """
-        self.move()
         if self.state == InfectionState.INF:    # every infected agent...
             self.spread()                       # spreads the infections
             self.infection_period()           # infection duration ending
@@ -159,12 +182,14 @@ class PersonAgent(Agent):
             self.target_state = None        # reset
 
         if self.give_birth:
-            # initial state may be vaccinated, if it is started and with a given probability
-            initial_state = InfectionState.VAC if self.model.vaccination_started and \
-                self.random.uniform(0, 1) < self.model.params['general_vaccination_rate'] \
-                else InfectionState.SUS
-            # create and add the agent
-            self.model.add_agent(self.model.create_agent(initial_state), self.pos)
+            # the newborn is in the youngest age group, its mobility class is drawn when it is created,
+            # and it may be vaccinated with the vaccination rate of its age group, if vaccination is started
+            child = self.model.create_agent(InfectionState.SUS, age_group=0)
+            if self.model.vaccination_started and \
+                    self.random.uniform(0, 1) < self.model.attributes.lookup('vaccination_rate', child.row):
+                child.state = InfectionState.VAC
+            # add the agent
+            self.model.add_agent(child, self.pos)
         if self.die:
             self.model.dead_agents.append(self)
 
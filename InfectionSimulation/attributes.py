@@ -0,0 +1,160 @@
+"""
+Per-agent attributes stored as NumPy columns, indexed by the row of every agent. Agents belong to an
+age group and a mobility class, and the parameters of their groups are looked up by index for all
+agents at once, instead of being stored as Python attributes of every agent
+"""
+import numpy as np
+
+
+# parameters an age group can set, with the simulation parameter (or value) they default to
+AGE_GROUP_PARAMS = {'mortality_rate': 'mortality_rate', 'vaccination_rate': 'general_vaccination_rate',
+                    'susceptibility': 1.}
+# parameters a mobility class can set
+MOBILITY_CLASS_PARAMS = {'mobility': 1.}
+
+
+def group_table(groups: list, defaults: dict, params: dict) -> dict:
+    """
+    Arrays of the fraction and every parameter of the groups, by group index. Without groups, there is
+    one group with the default values
+
+    Parameters
+    ----------
+    groups : list
+        Dicts with the fraction of agents in every group and the parameters it sets
+    defaults : dict
+        Maps every parameter to the simulation parameter it defaults to, or to a value
+    params : dict
+        Simulation parameters
+
+    Returns
+    -------
+    dict
+        Maps 'fraction' and every parameter to an array with a value for every group
+    """
+    groups = groups or [{'fraction': 1.}]
+    table = {'fraction': np.array([group['fraction'] for group in groups], dtype=float)}
+    for name, default in defaults.items():
+        default = params[default] if isinstance(default, str) else default
+        table[name] = np.array([group.get(name, default) for group in groups], dtype=float)
+    return table
+
+
+class AgentAttributes:
+    """
+    Columns of the group indices of every agent, which grow when they are full. Rows of removed agents
+    are reused by new ones. Age groups are ordered from the youngest, which newborns belong to
+    """
+
+    def __init__(self, params: dict, capacity: int = 1024):
+        """
+        Parameters
+        ----------
+        params : dict
+            Simulation parameters, with the age groups and mobility classes
+        capacity : int
+            Initial number of rows
+        """
+        # group tables, and the column of the group index of every agent
+        self.groups = {'age_group': group_table(params['age_groups'], AGE_GROUP_PARAMS, params),
+                       'mobility_class': group_table(params['mobility_classes'], MOBILITY_CLASS_PARAMS, params)}
+        self.columns = {name: np.zeros(capacity, dtype=np.int16) for name in self.groups}
+        # whether the row belongs to an agent, so that a row is only freed once
+        self.alive = np.zeros(capacity, dtype=bool)
+        # state value and cell of every agent, kept up to date by the agents and the model so that the
+        # grid can be aggregated without visiting every agent
+        self.states = np.zeros(capacity, dtype=np.int8)
+        self.xs = np.zeros(capacity, dtype=np.int32)
+        self.ys = np.zeros(capacity, dtype=np.int32)
+        # the column every group parameter is looked up by
+        self.parameters = {parameter: name for name, table in self.groups.items() for parameter in table
+                           if parameter != 'fraction'}
+        self.size = 0   # number of rows ever used
+        self.free = []  # rows of removed agents
+
+    def add(self, count: int, age_group: int = None) -> np.ndarray:
+        """
+        Allocates rows for new agents, and draws their groups with the fractions of the groups
+
+        Parameters
+        ----------
+        count : int
+            Number of agents
+        age_group : int, optional
+            Age group of the agents, for example 0 for newborns, instead of a drawn one
+
+        Returns
+        -------
+        np.ndarray
+            The rows of the agents
+        """
+        reused = [self.free.pop() for _ in range(min(count, len(self.free)))]
+        new = np.arange(self.size, self.size + count - len(reused))
+        self.size += len(new)
+        if self.size > len(self.alive):
+            self.grow()
+        rows = np.concatenate((np.array(reused, dtype=np.int64), new))
+        self.alive[rows] = True
+        for name, table in self.groups.items():
+            if name == 'age_group' and age_group is not None:
+                self.columns[name][rows] = age_group
+            # with a single group, no numbers are drawn, so runs without groups are unchanged
+            elif len(table['fraction']) > 1:
+                self.columns[name][rows] = np.random.choice(len(table['fraction']), count, p=table['fraction'])
+            else:
+                self.columns[name][rows] = 0
+        return rows
+
+    def remove(self, row: int):
+        """
+        Frees the row of a removed agent. Freeing it again does nothing
+        """
+        if self.alive[row]:
+            self.alive[row] = False
+            self.free.append(row)
+
+    def grow(self):
+        capacity = len(self.alive)
+        while capacity < self.size:
+            capacity *= 2
+
+        def resized(column: np.ndarray) -> np.ndarray:
+            result = np.zeros(capacity, dtype=column.dtype)
+            result[:len(column)] = column
+            return result
+        self.columns = {name: resized(column) for name, column in self.columns.items()}
+        self.alive, self.states, self.xs, self.ys = map(resized, (self.alive, self.states, self.xs, self.ys))
+
+    def place(self, rows, xs, ys):
+        """
+        Records the cells of agents, given by their rows
+        """
+        self.xs[rows] = xs
+        self.ys[rows] = ys
+
+    def cells(self):
+        """
+        State values and cells of every agent, as arrays (states, xs, ys)
+        """
+        rows = np.flatnonzero(self.alive[:self.size])
+        return self.states[rows], self.xs[rows], self.ys[rows]
+
+    def lookup(self, parameter: str, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Value of a group parameter for the given rows, or for every row ever used
+
+        Parameters
+        ----------
+        parameter : str
+            Name of a parameter of age groups or mobility classes
+        rows : np.ndarray, optional
+            Rows of the agents
+
+        Returns
+        -------
+        np.ndarray
+            The value of the parameter of the group of every agent
+        """
+        name = self.parameters[parameter]
+        groups = self.columns[name][:self.size] if rows is None else self.columns[name][rows]
+        return self.groups[name][parameter][groups]
@@ -0,0 +1,67 @@
+"""
+Grid that can move all agents at once
+"""
+from typing import List
+import numpy as np
+from mesa import Agent
+from mesa.space import MultiGrid
+
+
+class BulkMultiGrid(MultiGrid):
+    """
+    Toroidal MultiGrid with a bulk alternative to move_agent. Instead of removing every agent from
+    its cell list and appending it to another one, the cell lists are rebuilt from the new positions
+    of all agents, grouped by cell with a sort of their flat cell indices
+    """
+
+    def __init__(self, width: int, height: int):
+        """
+        Parameters
+        ----------
+        width, height : int
+            Grid dimensions
+        """
+        super().__init__(width, height, True)
+
+    def move_agents(self, agents: List[Agent], xs: np.ndarray, ys: np.ndarray):
+        """
+        Moves every agent to its new position. Positions outside the grid are wrapped around
+
+        Parameters
+        ----------
+        agents : List[Agent]
+            All agents on the grid
+        xs, ys : np.ndarray
+            Integer arrays, the new position of agents[i] is (xs[i], ys[i])
+
+        Returns
+        -------
+        tuple
+            (xs, ys), the new positions wrapped around into the grid
+        """
+        xs = np.mod(xs, self.width)
+        ys = np.mod(ys, self.height)
+        flat = xs * self.height + ys
+        # stable sort, so agents keep their relative order inside a cell
+        order = np.argsort(flat, kind='stable')
+        cells, starts = np.unique(flat[order], return_index=True)
+
+        agents_array = np.empty(len(agents), dtype=object)
+        agents_array[:] = agents
+        groups = np.split(agents_array[order], starts[1:])
+
+        positions = list(zip((cells // self.height).tolist(), (cells % self.height).tolist()))
+        previous = {agent.pos for agent in agents}
+        occupied = set(positions)
+
+        for x, y in previous - occupied:
+            self.grid[x][y] = []
+        for (x, y), group in zip(positions, groups):
+            self.grid[x][y] = group.tolist()
+
+        self.empties |= previous - occupied
+        self.empties -= occupied
+
+        for agent, x, y in zip(agents, xs.tolist(), ys.tolist()):
+            agent.pos = (x, y)
+        return xs, ys
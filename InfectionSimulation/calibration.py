@@ -0,0 +1,242 @@
+"""
+Calibration of simulation parameters to observed curves. Every candidate parameter set is run as a
+batch of seeded replicates in a process pool, and a quadratic surrogate of the loss, fitted to all
+evaluations so far, chooses the next candidates. Runs are stored in the run cache configured in the
+parameters, so repeated candidates are never simulated twice
+"""
+import os
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+try:
+    from static_run import simulate
+    from run_cache import RunCache
+except ImportError:
+    from InfectionSimulation.static_run import simulate
+    from InfectionSimulation.run_cache import RunCache
+
+
+def apply(params: dict, values: dict, templates: dict = None) -> dict:
+    """
+    Returns a copy of the parameters with the given values
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    values : dict
+        Values that have the name of a parameter replace it, rounded for integer parameters. The
+        others are coefficients of the templates
+    templates : dict, optional
+        Maps parameter names to format strings, filled with the values. For example,
+        {'infection_chance_function': '{peak} * np.exp(-dist / {length})'} calibrates the coefficients
+        peak and length of the infection chance
+
+    Returns
+    -------
+    dict
+        The new parameters
+    """
+    params = dict(params)
+    for name, value in values.items():
+        if name in params:
+            params[name] = int(round(value)) if type(params[name]) is int else float(value)
+    for name, template in (templates or {}).items():
+        params[name] = template.format(**{key: float(value) for key, value in values.items()})
+    return params
+
+
+def curve_loss(simulated: pd.DataFrame, observed: pd.DataFrame) -> float:
+    """
+    Mean squared error of the simulated curves at the observed steps, for every observed column. Every
+    column is scaled by its largest observed value, and runs that stopped early keep their last values
+
+    Parameters
+    ----------
+    simulated : pd.DataFrame
+        Collected statistics, indexed by step
+    observed : pd.DataFrame
+        Observed statistics, indexed by step, with some of the columns of the simulated data
+
+    Returns
+    -------
+    float
+        The loss
+    """
+    steps = observed.index
+    simulated = simulated.reindex(simulated.index.union(steps)).ffill().reindex(steps)[observed.columns]
+    scale = np.maximum(observed.abs().max().to_numpy(dtype=float), 1)
+    return float(np.nanmean(((simulated.to_numpy(dtype=float) - observed.to_numpy(dtype=float)) / scale) ** 2))
+
+
+class QuadraticSurrogate:
+    """
+    Least squares fit of a quadratic function (with every pairwise product) to the losses of the
+    evaluated points
+    """
+
+    def __init__(self, dimensions: int, ridge: float = 1e-6):
+        self.dimensions = dimensions
+        self.rows, self.columns = np.triu_indices(dimensions)
+        self.ridge = ridge
+        self.weights = None
+
+    def features(self, x: np.ndarray) -> np.ndarray:
+        return np.hstack((np.ones((len(x), 1)), x, x[:, self.rows] * x[:, self.columns]))
+
+    def size(self) -> int:
+        """
+        Number of coefficients, and points needed for a fit
+        """
+        return 1 + self.dimensions + len(self.rows)
+
+    def fit(self, x: np.ndarray, y: np.ndarray):
+        features = self.features(x)
+        # small ridge term, so that the fit is defined even with few or degenerate points
+        self.weights = np.linalg.solve(features.T @ features + self.ridge * np.eye(features.shape[1]),
+                                       features.T @ y)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.features(x) @ self.weights
+
+
+class Calibration:
+    """
+    Searches the values within bounds that minimize curve_loss of the mean of the replicates against
+    the observed curves. Candidates are in coordinates normalized to [0, 1] within the bounds
+    """
+
+    def __init__(self, params: dict, observed: pd.DataFrame, bounds: dict, templates: dict = None,
+                 replicates: int = 4, processes: int = None, seed: int = 0,
+                 min_distance: float = 0.01):
+        """
+        Parameters
+        ----------
+        params : dict
+            Simulation parameters the candidates are applied to
+        observed : pd.DataFrame
+            Observed statistics, indexed by step
+        bounds : dict
+            Maps the name of every calibrated value (a parameter or a template coefficient) to its
+            (low, high) bounds
+        templates : dict, optional
+            Parameters built from coefficients, see apply
+        replicates : int
+            Number of runs of every candidate, with different seeds
+        processes : int, optional
+            Number of processes runs are split across, defaults to the number of cores
+        seed : int
+            Seed the seeds of the replicates are generated from. Every candidate is run with the same
+            seeds, so that differences between candidates aren't hidden by noise
+        min_distance : float
+            Normalized distance within which a candidate is considered already evaluated
+        """
+        self.params = params
+        self.observed = observed
+        self.names = list(bounds)
+        self.low = np.array([bounds[name][0] for name in self.names], dtype=float)
+        self.high = np.array([bounds[name][1] for name in self.names], dtype=float)
+        self.integer = np.array([type(params.get(name)) is int for name in self.names])
+        self.templates = templates or {}
+        self.processes = processes or os.cpu_count() or 1
+        self.cache = RunCache.for_params(params)
+        self.seeds = np.random.SeedSequence(seed).generate_state(replicates).tolist()
+        self.min_distance = min_distance
+        self.rng = np.random.default_rng(seed)
+        self.surrogate = QuadraticSurrogate(len(self.names))
+        self.points = np.empty((0, len(self.names)))
+        self.losses = np.empty(0)
+
+    def values(self, point: np.ndarray) -> dict:
+        return dict(zip(self.names, (self.low + point * (self.high - self.low)).tolist()))
+
+    def snap(self, points: np.ndarray) -> np.ndarray:
+        """
+        Moves the points to the nearest integer values of integer parameters
+        """
+        values = self.low + points * (self.high - self.low)
+        values[:, self.integer] = np.round(values[:, self.integer])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            points = (values - self.low) / (self.high - self.low)
+        return np.nan_to_num(np.clip(points, 0, 1))
+
+    def evaluate(self, points: np.ndarray, pool) -> np.ndarray:
+        """
+        Runs the replicates of every point that aren't cached, and returns the loss of every point. The
+        runs store themselves in the cache
+        """
+        candidates = [apply(self.params, self.values(point), self.templates) for point in points]
+        runs = {}
+        missing = []
+        for i, params in enumerate(candidates):
+            for seed in self.seeds:
+                runs[i, seed] = self.cache.get(params, seed) if self.cache is not None else None
+                if runs[i, seed] is None:
+                    missing.append((i, seed))
+        results = pool.starmap(simulate, [(candidates[i], seed) for i, seed in missing])
+        for (i, seed), data in zip(missing, results):
+            runs[i, seed] = data
+
+        losses = []
+        steps = self.observed.index
+        for i in range(len(candidates)):
+            # mean of the replicates at the observed steps, where runs that stopped keep their last values
+            mean = sum(run.reindex(run.index.union(steps)).ffill().reindex(steps)
+                       for run in (runs[i, seed] for seed in self.seeds)) / len(self.seeds)
+            losses.append(curve_loss(mean, self.observed))
+        losses = np.array(losses)
+        self.points = np.vstack((self.points, points))
+        self.losses = np.append(self.losses, losses)
+        return losses
+
+    def propose(self, count: int, samples: int = 4096) -> np.ndarray:
+        """
+        Chooses the next points to evaluate: a random design until there are enough points for the
+        surrogate, then the points with the lowest predicted loss among random samples and samples
+        near the best point, which aren't within min_distance of evaluated or chosen points
+        """
+        dimensions = len(self.names)
+        if len(self.points) < self.surrogate.size():
+            # latin hypercube, every dimension split in count strata
+            strata = np.argsort(self.rng.random((dimensions, count)), axis=1).T
+            return self.snap((strata + self.rng.random((count, dimensions))) / count)
+
+        self.surrogate.fit(self.points, self.losses)
+        best = self.points[np.argmin(self.losses)]
+        candidates = np.vstack((self.rng.random((samples // 2, dimensions)),
+                                best + self.rng.normal(0, 0.1, (samples - samples // 2, dimensions))))
+        candidates = self.snap(np.clip(candidates, 0, 1))
+        chosen = []
+        for candidate in candidates[np.argsort(self.surrogate.predict(candidates))]:
+            others = np.vstack([self.points] + chosen)
+            if np.min(np.linalg.norm(others - candidate, axis=1)) > self.min_distance:
+                chosen.append(candidate[np.newaxis])
+                if len(chosen) == count:
+                    break
+        return np.vstack(chosen) if chosen else np.empty((0, dimensions))
+
+    def run(self, iterations: int = 10, batch: int = None):
+        """
+        Evaluates batches of proposed points
+
+        Parameters
+        ----------
+        iterations : int
+            Number of batches
+        batch : int, optional
+            Number of points in a batch, defaults to the number of processes
+
+        Returns
+        -------
+        tuple
+            (params, values, loss) of the best point evaluated so far
+        """
+        batch = batch or self.processes
+        with Pool(self.processes) as pool:
+            for _ in range(iterations):
+                points = self.propose(batch)
+                if len(points) == 0:
+                    break
+                self.evaluate(points, pool)
+        values = self.values(self.points[np.argmin(self.losses)])
+        return apply(self.params, values, self.templates), values, float(self.losses.min())
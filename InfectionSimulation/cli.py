@@ -0,0 +1,93 @@
+"""
+Command line entry point for static runs, which doesn't import the GUI or the visualization
+
+    python cli.py --set num_agents=500 --set seed=1 --runs 4 --output run_data_{id}.csv
+"""
+import argparse
+import ast
+import json
+import time
+from multiprocessing import freeze_support
+try:
+    from simulation_parameters import DEFAULT_PARAMS, sanity_check
+    from job_manager import JobManager
+except ImportError:
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS, sanity_check
+    from InfectionSimulation.job_manager import JobManager
+
+
+def coerce(name: str, value):
+    """
+    Converts an integer value of a float parameter to a float, like the GUI does
+    """
+    if name not in DEFAULT_PARAMS:
+        raise ValueError(f'unknown parameter {name}')
+    if isinstance(DEFAULT_PARAMS[name], float) and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def parse_value(name: str, text: str):
+    """
+    Converts the text of a parameter value to the type of its default value
+    """
+    if isinstance(DEFAULT_PARAMS.get(name), str):
+        return text
+    return coerce(name, ast.literal_eval(text))
+
+
+def parse_params(arguments) -> dict:
+    """
+    Builds the parameters from the defaults, the parameter file and the --set overrides, in that order
+    """
+    params = dict(DEFAULT_PARAMS)
+    if arguments.params is not None:
+        with open(arguments.params) as f:
+            params.update({name: coerce(name, value) for name, value in json.load(f).items()})
+    for assignment in arguments.set:
+        name, _, text = assignment.partition('=')
+        if name not in DEFAULT_PARAMS:
+            raise ValueError(f'unknown parameter {name}')
+        try:
+            params[name] = parse_value(name, text)
+        except (ValueError, SyntaxError):
+            raise ValueError(f'invalid value for {name}: {text}') from None
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the infection simulation without visualization, and '
+                                                 'saves the collected data as csv files')
+    parser.add_argument('--params', help='json file with parameter values, the others keep their defaults')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='sets a parameter, as a Python literal (text for infection_chance_function)')
+    parser.add_argument('--runs', type=int, default=1, help='number of runs. Seeded runs get consecutive seeds')
+    parser.add_argument('--workers', type=int, help='maximum number of concurrent runs, defaults to the number '
+                                                    'of cores')
+    parser.add_argument('--output', default='run_data_{id}.csv',
+                        help='csv file of every run, formatted with its id (starting at 1)')
+    arguments = parser.parse_args(argv)
+
+    try:
+        params = parse_params(arguments)
+        sanity_check(params)
+    except (ValueError, AssertionError) as error:
+        parser.error(str(error) or 'invalid parameters')
+
+    manager = JobManager(arguments.workers, arguments.output)
+    for run in range(arguments.runs):
+        manager.submit(dict(params, seed=params['seed'] + run if params['seed'] != -1 else -1))
+    try:
+        while manager.active():
+            time.sleep(0.5)
+            manager.poll()
+    except KeyboardInterrupt:
+        manager.cancel_all()
+    for job in manager.jobs:
+        print(job.describe())
+    return 0 if all(job.status == 'finished' for job in manager.jobs) else 1
+
+
+if __name__ == '__main__':
+    freeze_support()
+    raise SystemExit(main())
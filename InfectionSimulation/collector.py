@@ -0,0 +1,153 @@
+"""
+Data collector that stores statistics in NumPy arrays, with optional change triggered collection and
+downsampling
+"""
+import numpy as np
+import pandas as pd
+try:
+    from utility import STATISTICS
+except ImportError:
+    from InfectionSimulation.utility import STATISTICS
+
+
+class ArrayDataCollector:
+    """
+    Collects model.statistics into preallocated arrays that double in size when they are full,
+    instead of lists of dicts like mesa's DataCollector.
+
+    With a change threshold, a row is only recorded when a statistic changed by more than the threshold
+    (relative to its last recorded value) or when quiet_interval steps passed since the last row, so
+    outbreaks are kept at full resolution and quiet periods at a coarse one. With max_rows, every other
+    quiet row is dropped whenever the collector fills up, and quiet rows are recorded half as often from
+    then on, which bounds memory for any run length.
+    """
+
+    def __init__(self, names: tuple = STATISTICS, change_threshold: float = 0., quiet_interval: int = 1,
+                 max_rows: int = 0, capacity: int = 1024):
+        """
+        Parameters
+        ----------
+        names : tuple
+            Names of the statistics to collect, keys of model.statistics
+        change_threshold : float
+            Relative change of a statistic that triggers a row, 0 to record every row
+        quiet_interval : int
+            Maximum number of steps between two rows when nothing changes
+        max_rows : int
+            Number of rows at which quiet rows are downsampled, 0 for no limit
+        capacity : int
+            Initial number of rows
+        """
+        self.names = tuple(names)
+        self.change_threshold = change_threshold
+        self.quiet_interval = quiet_interval
+        self.max_rows = max_rows
+        # minimum number of steps between two quiet rows, doubled by every downsampling so that
+        # later rows have the same resolution as the downsampled ones
+        self.spacing = quiet_interval if change_threshold > 0 else 1
+        self.rows = 0
+        self.steps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, len(self.names)), dtype=np.int64)
+        # rows recorded because of a change, which downsampling keeps while there are enough quiet rows
+        self.significant = np.empty(capacity, dtype=bool)
+        # model_vars, as lists extended with the rows recorded since they were last read
+        self.lists = {name: [] for name in self.names}
+        self.listed = 0
+
+    def collect(self, model) -> bool:
+        """
+        Records the statistics of the model at its current step, if they should be
+
+        Returns
+        -------
+        bool
+            Whether a row was recorded
+        """
+        values = np.fromiter((model.statistics[name] for name in self.names), dtype=np.int64, count=len(self.names))
+        significant = False
+        if self.rows > 0:
+            last = self.values[self.rows - 1]
+            if self.change_threshold > 0:
+                significant = bool(np.any(np.abs(values - last) >
+                                          self.change_threshold * np.maximum(np.abs(last), 1)))
+            if not significant and model.step_count - self.steps[self.rows - 1] < self.spacing:
+                return False
+        self.record(model.step_count, values, significant)
+        return True
+
+    def finish(self, model) -> bool:
+        """
+        Records the statistics of the model at its last step, if that step has no row, so that the data
+        ends with the state the run ended in even if it ended in a quiet period or between collections.
+        Called once the model stopped, after its step_count was incremented by the last step
+
+        Returns
+        -------
+        bool
+            Whether a row was recorded
+        """
+        step = model.step_count - 1
+        if step < 0 or (self.rows > 0 and self.steps[self.rows - 1] == step):
+            return False
+        values = np.fromiter((model.statistics[name] for name in self.names), dtype=np.int64, count=len(self.names))
+        self.record(step, values, False)
+        return True
+
+    def record(self, step: int, values: np.ndarray, significant: bool):
+        if self.rows == len(self.steps):
+            self.grow()
+        self.steps[self.rows] = step
+        self.values[self.rows] = values
+        self.significant[self.rows] = significant
+        self.rows += 1
+        if self.max_rows and self.rows >= self.max_rows:
+            self.downsample()
+
+    def grow(self):
+        capacity = 2 * len(self.steps)
+        self.steps = np.resize(self.steps, capacity)
+        self.values = np.resize(self.values, (capacity, len(self.names)))
+        self.significant = np.resize(self.significant, capacity)
+
+    def downsample(self):
+        """
+        Drops every other quiet row, or every other row if fewer than half are quiet. The first and
+        last rows are always kept
+        """
+        significant = self.significant[:self.rows]
+        quiet = np.flatnonzero(~significant[1:-1]) + 1
+        if len(quiet) >= self.rows // 2:
+            drop = quiet[1::2]
+        else:
+            drop = np.arange(1, self.rows - 1, 2)
+        keep = np.ones(self.rows, dtype=bool)
+        keep[drop] = False
+        count = int(keep.sum())
+        self.steps[:count] = self.steps[:self.rows][keep]
+        self.values[:count] = self.values[:self.rows][keep]
+        self.significant[:count] = significant[keep]
+        self.rows = count
+        self.spacing *= 2
+        # rows were dropped, so model_vars is listed again
+        self.lists = {name: [] for name in self.names}
+        self.listed = 0
+
+    @property
+    def model_vars(self) -> dict:
+        """
+        Lists of the collected values of every statistic, like DataCollector.model_vars. The values are
+        Python ints, since mesa's ChartModule sends them to the browser as json. The lists are kept
+        between reads and only extended with new rows, so reading them every frame stays cheap
+        """
+        if self.listed < self.rows:
+            for i, name in enumerate(self.names):
+                self.lists[name].extend(self.values[self.listed:self.rows, i].tolist())
+            self.listed = self.rows
+        return self.lists
+
+    def get_model_vars_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the collected values as a DataFrame with a column per statistic, indexed by step
+        """
+        return pd.DataFrame(self.values[:self.rows], columns=list(self.names),
+                            index=pd.Index(self.steps[:self.rows], name='step'))
@@ -0,0 +1,251 @@
+"""
+Mean-field approximation of the agent model, which computes approximate curves in milliseconds
+
+The population is split into compartments that follow the rules agents follow, hour by hour. Infected
+and recovered agents are chained by the number of hours they have been in their state, so that they
+leave it with the same erlang based chance agents do (see infection_end_chance). Agents are assumed to
+be spread uniformly over the grid, so a susceptible agent meets infected / (grid_width * grid_height)
+infected agents in every cell of the infection radius
+"""
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+try:
+    from utility import STATISTICS, distance_kernel
+    from static_run import simulate
+    import simulation_parameters
+except ImportError:
+    from InfectionSimulation.utility import STATISTICS, distance_kernel
+    from InfectionSimulation.static_run import simulate
+    from InfectionSimulation import simulation_parameters
+
+
+# survival below which the chain of a state is cut, and the rest leave it in the last compartment
+MIN_SURVIVAL = 1e-9
+# number of evaluations the mean of a random infection chance is estimated from
+KERNEL_SAMPLES = 256
+
+
+def kernel_chance(params: dict) -> float:
+    """
+    Expected sum of the infection chance over every cell within infection radius. Chances are clipped
+    to [0, 1] like the comparison agents make with a uniform random number. A random infection chance is
+    sampled with a generator seeded by the seed parameter (0 without one), so that the estimate is the
+    same every time, and doesn't change the random state of the simulation
+    """
+    rng = np.random.default_rng(max(params['seed'], 0))
+    kernel = distance_kernel(params['infection_radius'], params['grid_width'], params['grid_height'])
+    distances = kernel[~np.isnan(kernel)]
+    samples = np.broadcast_to(distances, (KERNEL_SAMPLES, len(distances)))
+    chances = simulation_parameters.infection_chance(params, samples, rng)
+    return float(np.clip(chances, 0, 1).sum(axis=1).mean())
+
+
+def end_chances(end_chance, params: dict) -> np.ndarray:
+    """
+    Chance of leaving a state after every number of hours in it, up to the hour by which almost every
+    agent has left it. The last chance is 1
+    """
+    hours = 256
+    while True:
+        chances = np.asarray(end_chance(params, np.arange(hours)), dtype=float)
+        survival = np.cumprod(1 - chances)
+        if survival[-1] <= MIN_SURVIVAL:
+            break
+        hours *= 2
+    chances = chances[:np.argmax(survival <= MIN_SURVIVAL) + 1].copy()
+    chances[-1] = 1.
+    return chances
+
+
+class Chain:
+    """
+    Agents in a state, by the number of hours they have been in it. Instead of moving every compartment
+    along the chain every hour, the chain holds the number of agents that entered it every hour, in a
+    ring buffer, and weighs them by the fraction still in the state at their age
+    """
+
+    def __init__(self, chances: np.ndarray):
+        """
+        Parameters
+        ----------
+        chances : np.ndarray
+            Chance of leaving the state after every number of hours in it, as returned by end_chances
+        """
+        self.length = len(chances)
+        survival = np.concatenate(([1.], np.cumprod(1 - chances)[:-1]))
+        # weights by age, repeated so that a slice is the weights rotated to the position of age 0
+        self.survival = np.tile(survival, 2)
+        self.leaving = np.tile(survival * chances, 2)
+        self.entered = np.zeros(self.length)
+        self.head = 0   # position of age 0 in entered
+
+    def weights(self, weights: np.ndarray) -> np.ndarray:
+        return weights[self.length - self.head:2 * self.length - self.head]
+
+    def total(self) -> float:
+        return float(self.entered @ self.weights(self.survival))
+
+    def leaving_total(self) -> float:
+        return float(self.entered @ self.weights(self.leaving))
+
+    def enter(self, count: float):
+        self.entered[self.head] += count
+
+    def scale(self, factor: float):
+        """
+        Keeps a fraction of the agents of every age
+        """
+        self.entered *= factor
+
+    def advance(self):
+        """
+        Moves every agent one hour along the chain. The agents that reached the end have all left
+        """
+        self.head = (self.head - 1) % self.length
+        self.entered[self.head] = 0.
+
+
+def solve(params: dict, stop_at_extinction: bool = True) -> pd.DataFrame:
+    """
+    Runs the mean-field model
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    stop_at_extinction : bool
+        Whether to stop when less than half an agent is infected, like the agent model stops once
+        nobody is infected
+
+    Returns
+    -------
+    pd.DataFrame
+        Expected statistics every data_collection_frequency steps, with the columns of the agent
+        model and indexed by step
+    """
+    area = params['grid_width'] * params['grid_height']
+    contact = kernel_chance(params) / area
+    infected = Chain(end_chances(simulation_parameters.infection_end_chance, params))
+    recovered = Chain(end_chances(simulation_parameters.recovered_end_chance, params))
+    mortality = params['mortality_rate']
+    external = params['external_infection_chance']
+    vaccination = params['general_vaccination_rate']
+    birth = params['population_birth_rate'] / 8760
+    death = params['population_death_rate'] / 8760
+
+    initial = params['num_agents'] * params['initial_infected_chance']
+    infected.enter(initial)
+    susceptible = params['num_agents'] - initial
+    vaccinated = 0.
+    totals = {'deaths': 0., 'total_infections': initial, 'total_recoveries': 0.}
+    vaccination_started = False
+
+    steps, rows = [], []
+    for step in range(params['max_iterations']):
+        infected_total, recovered_total = infected.total(), recovered.total()
+        # once a day, agents in any state may be infected from outside, and spread it the same hour
+        if step % 24 == 0 and external > 0:
+            totals['total_infections'] += external * (susceptible + infected_total + recovered_total + vaccinated)
+            externally_infected = external * (susceptible + recovered_total + vaccinated)
+            infected.enter(externally_infected)
+            infected_total += externally_infected
+            recovered.scale(1 - external)
+            recovered_total *= 1 - external
+            susceptible *= 1 - external
+            vaccinated *= 1 - external
+
+        alive = susceptible + infected_total + recovered_total + vaccinated
+        # every infected agent tries to infect every susceptible agent in range
+        pressure = infected_total * contact
+        infections = susceptible * -np.expm1(-pressure)
+        totals['total_infections'] += susceptible * pressure
+        vaccinations = (susceptible - infections) * vaccination if vaccination_started else 0.
+
+        leaving = infected.leaving_total()
+        deaths = leaving * mortality
+        recoveries = leaving - deaths
+        totals['total_recoveries'] += recoveries
+
+        # chains advance by an hour
+        infected.advance()
+        infected.enter(infections)
+        if params['has_recovery_immunity']:
+            immunity_lost = recovered.leaving_total()
+            recovered.advance()
+            recovered.enter(recoveries)
+            susceptible += immunity_lost - infections - vaccinations
+        else:
+            susceptible += recoveries - infections - vaccinations
+        vaccinated += vaccinations
+
+        # births and natural deaths, in every state. Like agents, newborns are vaccinated with the
+        # general vaccination rate
+        born = alive * birth
+        vaccinated_born = born * vaccination if vaccination_started else 0.
+        susceptible = susceptible * (1 - death) + born - vaccinated_born
+        vaccinated = vaccinated * (1 - death) + vaccinated_born
+        infected.scale(1 - death)
+        recovered.scale(1 - death)
+        totals['deaths'] += deaths + alive * death
+
+        infected_total = infected.total()
+        if step % params['data_collection_frequency'] == 0:
+            recovered_total = recovered.total()
+            statistics = {
+                'infected': infected_total,
+                'recovered': recovered_total,
+                'susceptible': susceptible,
+                'vaccinated': vaccinated,
+                'alive': susceptible + infected_total + recovered_total + vaccinated,
+                **totals,
+            }
+            steps.append(step)
+            rows.append([statistics[name] for name in STATISTICS])
+
+        if not vaccination_started and params['vaccination_start'] != -1 and step + 1 > params['vaccination_start']:
+            vaccination_started = True
+        if stop_at_extinction and infected_total < 0.5:
+            break
+
+    return pd.DataFrame(rows, columns=list(STATISTICS), index=pd.Index(steps, name='step'))
+
+
+def compare(params: dict, replicates: int = 8, processes: int = None, seed: int = None) -> pd.DataFrame:
+    """
+    Compares the mean-field model with an ensemble of agent model runs
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    replicates : int
+        Number of agent model runs
+    processes : int, optional
+        Number of processes the runs are split across, defaults to the number of cores
+    seed : int, optional
+        Seed the seeds of the runs are generated from
+
+    Returns
+    -------
+    pd.DataFrame
+        For every statistic, the mean and standard deviation of the ensemble (runs that stopped are
+        continued with their last values), the mean-field value, and the error of the mean-field value
+        relative to the ensemble mean. Columns are (statistic, 'mean' | 'std' | 'mean_field' | 'error')
+    """
+    with Pool(processes) as pool:
+        seeds = np.random.SeedSequence(seed).generate_state(replicates).tolist()
+        runs = pool.starmap(simulate, [(params, run_seed) for run_seed in seeds])
+    steps = pd.Index(sorted(set().union(*(run.index for run in runs))), name='step')
+    # ensemble of shape (replicates, steps, statistics)
+    ensemble = np.stack([run.reindex(steps).ffill().to_numpy(dtype=float) for run in runs])
+    mean_field = solve(params, stop_at_extinction=False).reindex(steps).ffill()
+
+    columns = {}
+    for i, name in enumerate(STATISTICS):
+        mean = ensemble[:, :, i].mean(axis=0)
+        columns[name, 'mean'] = mean
+        columns[name, 'std'] = ensemble[:, :, i].std(axis=0)
+        columns[name, 'mean_field'] = mean_field[name].to_numpy()
+        columns[name, 'error'] = (mean_field[name].to_numpy() - mean) / np.maximum(np.abs(mean), 1)
+    return pd.DataFrame(columns, index=steps)
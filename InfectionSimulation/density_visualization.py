@@ -0,0 +1,69 @@
+"""
+Grid visualization that draws a per-block heatmap of agent states instead of every agent, so the
+cost of a frame depends on the canvas size rather than the number of agents
+"""
+import base64
+import os
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+try:
+    from utility import density_grid
+except ImportError:
+    from InfectionSimulation.utility import density_grid
+
+
+# colour of each state, indexed by InfectionState.value - 1. Same colours as agent_portrayal
+STATE_COLOURS = np.array([
+    (255, 0, 0),    # susceptible, red
+    (0, 128, 0),    # infected, green
+    (0, 0, 255),    # recovered, blue
+    (255, 255, 0),  # vaccinated, yellow
+], dtype=float)
+
+
+class DensityGrid(VisualizationElement):
+    """
+    Aggregates agents into blocks of cells, and sends the grid to the browser as a single RGBA
+    image. The colour of a block is the mix of the colours of the states of the agents in it, and
+    its opacity grows with the number of agents in it
+    """
+
+    def __init__(self, grid_width: int, grid_height: int, canvas_width: int = 500, canvas_height: int = 500):
+        """
+        Parameters
+        ----------
+        grid_width, grid_height : int
+            Grid dimensions
+        canvas_width, canvas_height : int
+            Size of the canvas drawn on in the browser, in pixels
+        """
+        super().__init__()
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        # blocks are made just big enough that there is at most one per pixel
+        self.block_size = max(1, -(-grid_width // canvas_width), -(-grid_height // canvas_height))
+
+        # the module code is inlined, so that it doesn't depend on the directory the server runs in
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DensityModule.js')) as f:
+            module_code = f.read()
+        self.js_code = module_code + "elements.push(new DensityModule({}, {}));".format(canvas_width,
+                                                                                       canvas_height)
+
+    def render(self, model):
+        counts = density_grid(model.attributes.cells(), self.grid_width, self.grid_height,
+                              self.block_size).astype(float)
+        total = counts.sum(axis=0)
+        occupied = total > 0
+
+        # weighted mean of the state colours, shape (blocks along width, blocks along height, 3)
+        colour = np.einsum('sxy,sc->xyc', counts, STATE_COLOURS)
+        colour[occupied] /= total[occupied, None]
+        # square root, so that sparsely populated blocks are still visible
+        alpha = 255 * np.sqrt(total / total.max()) if occupied.any() else np.zeros_like(total)
+
+        image = np.concatenate((colour, alpha[..., None]), axis=2).round().astype(np.uint8)
+        # image rows go top to bottom, while grid y goes bottom to top
+        image = image.transpose((1, 0, 2))[::-1]
+        return {"width": image.shape[1],
+                "height": image.shape[0],
+                "image": base64.b64encode(np.ascontiguousarray(image).tobytes()).decode('ascii')}
@@ -6,12 +6,17 @@ documentation = {
 
     'infection_chance_function': '''
     Function that defines the probability of infection as distance from infected agent increases (within Infection Radius)
-    This should be Python 3 code
-    Assume the distance is available as 'dist'
+    This should be a Python 3 expression of the distance, available as 'dist'
     The given expression should evaluate to a float in the range [0, 1]
-    Assume the following imports:
-    import numpy as np
-    import math
+    It is evaluated for every cell within Infection Radius at once when the simulation starts, unless it
+    draws from a distribution, in which case it is evaluated again for every contact with an infected agent
+    Only the following are allowed:
+    numbers, arithmetic, comparisons, and/or/not, x if condition else y (only the chosen one of x and y is
+    evaluated, so it can guard an index or a division, unlike np.where which evaluates both)
+    indexing lists of numbers, like [0.1, 0.05][min(round(dist), 1)]
+    min, max, round, abs
+    np.sqrt, np.exp, np.log, np.minimum, np.clip, np.where and similar, and the same math functions
+    np.random.normal, np.random.uniform and other distributions, drawn again for every contact
     ''',
 
     'external_infection_chance': '''
@@ -108,6 +113,14 @@ documentation = {
 
     'show_grid': '''
     Specific to Dynamic Visualization. Specifies whether the grid should be shown or not.
+    With more than Density Render Threshold agents, the grid is shown as a heatmap of agent states instead of
+    individual agents.
+    ''',
+
+    'density_render_threshold': '''
+    Specific to Dynamic Visualization. Number of agents above which the grid is shown as a heatmap of the
+    states of the agents in blocks of cells, instead of a circle for every agent.
+    Must be an integer.
     ''',
 
     'data_collection_frequency': '''
@@ -121,4 +134,99 @@ documentation = {
     The simulation automatically ends when there are no infected agents.
     Must be an integer.
     ''',
+
+    'collection_change_threshold': '''
+    Relative change of any statistic since the last collected data that triggers collection. Data is then
+    only collected (at most every Data Collection Frequency iterations) when something changes, or
+    every Collection Quiet Interval iterations. Specify 0 to collect every Data Collection Frequency iterations.
+    Must be a float.
+    ''',
+
+    'collection_quiet_interval': '''
+    Maximum number of iterations between two collections when Collection Change Threshold is set.
+    Must be an integer.
+    ''',
+
+    'collection_max_rows': '''
+    Number of collected rows at which the data is downsampled, by dropping every other row collected
+    during quiet periods. Specify 0 to keep every row.
+    Must be an integer.
+    ''',
+
+    'regions': '''
+    Metapopulation mode. A list of regions, each simulated on its own grid. Every region is a dict that can
+    set grid_width, grid_height, num_agents and initial_infected_chance, the other parameters are shared.
+    Specify an empty list to simulate a single grid.
+    ''',
+
+    'travel_rates': '''
+    Links between regions, as a list of [source, target, rate] where rate is the probability that an agent
+    of the source region travels to the target region in an hour. Travellers keep their infection state.
+    ''',
+
+    'travel_interval': '''
+    Number of iterations between two batches of travel between regions.
+    Must be an integer.
+    ''',
+
+    'region_workers': '''
+    Number of processes the regions are split across and stepped in parallel. Specify 0 to step them
+    all in the main process.
+    Must be an integer.
+    ''',
+
+    'tracing_file': '''
+    Specific to Static Visualization. File every infection is logged to, as the step, the ids of the infector and
+    the infected agent, and the distance between them. Infections from outside and initially infected agents
+    have no infector. tracing.py reads the file, and computes generation intervals and R_t from it.
+    Specify an empty string to disable.
+    ''',
+
+    'age_groups': '''
+    Heterogeneous agents. A list of age groups, each a dict with the fraction of agents in it, and optionally its
+    mortality_rate, vaccination_rate (the general vaccination rate by default) and susceptibility, the factor
+    the infection chance of its agents is multiplied by. Groups are ordered from the youngest: newborns belong
+    to the first group, and the group of every other agent is drawn when it is created.
+    Specify an empty list for a single group with the global parameters.
+    ''',
+
+    'mobility_classes': '''
+    A list of mobility classes, each a dict with the fraction of agents in it and optionally its mobility, the
+    factor the distance its agents move is multiplied by. Specify an empty list for a single class.
+    ''',
+
+    'seed': '''
+    Seed of the random number generators, so that a run can be reproduced. Specify -1 for a different run
+    every time, which also means the run is never loaded from the run cache.
+    Must be an integer.
+    ''',
+
+    'run_cache_directory': '''
+    Directory the data of seeded runs is cached in. A run with the same parameters and seed as a cached one is
+    loaded instead of simulated, so pressing Static Run again returns instantly. Only runs with a Seed are
+    cached: with the default Seed of -1 every run is different, and is always simulated. Runs of regions or
+    with a tracing file are always simulated. Specify an empty string to disable the cache.
+    ''',
+
+    'run_cache_size': '''
+    Size of the run cache in megabytes. When it is exceeded, the least recently used runs are removed.
+    Must be a float.
+    ''',
+
+    'telemetry_port': '''
+    Specific to Static Visualization. Port on localhost that aggregated statistics are streamed on while the
+    simulation runs, as server-sent events. Specify -1 to disable.
+    Must be an integer.
+    ''',
+
+    'telemetry_interval': '''
+    Minimum number of seconds between two telemetry updates.
+    Must be a float.
+    ''',
+
+    'telemetry_block_size': '''
+    Side of the square blocks of cells agents are counted in for the density grid sent with telemetry updates.
+    Specify 0 to not send a density grid.
+    Must be an integer.
+    ''',
 }
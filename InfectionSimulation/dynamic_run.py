@@ -7,9 +7,11 @@ try:
     from model import InfectionModel
     import simulation_parameters as params
     from utility import InfectionState
+    from density_visualization import DensityGrid
 except ImportError:
     from InfectionSimulation.model import InfectionModel
     from InfectionSimulation.utility import InfectionState
+    from InfectionSimulation.density_visualization import DensityGrid
 
 
 def agent_portrayal(agent):
@@ -49,8 +51,13 @@ visualization_elements = [chart1, chart2]
 def dynamic_run(params: dict):
     if params['show_grid']:
         # visual grid on which agents move
-        grid = CanvasGrid(agent_portrayal, params['grid_width'], params['grid_height'],
-                          500, 500)
+        # above density_render_threshold agents, the grid is drawn as a density heatmap instead of one
+        # circle per agent
+        if params['num_agents'] > params['density_render_threshold']:
+            grid = DensityGrid(params['grid_width'], params['grid_height'], 500, 500)
+        else:
+            grid = CanvasGrid(agent_portrayal, params['grid_width'], params['grid_height'],
+                              500, 500)
         visualization_elements.insert(0, grid)
 
     server = ModularServer(InfectionModel, visualization_elements, "Infection Model", {"params": params})
@@ -0,0 +1,271 @@
+"""
+Compiler for the infection chance expression, which allows only arithmetic and NumPy style operations on
+the distance, and produces a function evaluated on an array of distances at once
+"""
+import ast
+import numpy as np
+
+
+class ExpressionError(ValueError):
+    """
+    Raised when an expression is invalid or uses something that isn't allowed
+    """
+
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power,
+}
+UNARY_OPERATORS = {
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+    ast.Not: np.logical_not,
+}
+COMPARISONS = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+BOOLEAN_OPERATORS = {
+    ast.And: np.logical_and,
+    ast.Or: np.logical_or,
+}
+
+# elementwise functions, by the name they are called with
+FUNCTIONS = {
+    'min': np.minimum,
+    'max': np.maximum,
+    'round': np.round,
+    'abs': np.abs,
+}
+for name in ('abs', 'sqrt', 'exp', 'log', 'log2', 'log10', 'sin', 'cos', 'tan', 'arctan', 'tanh', 'floor', 'ceil',
+             'round', 'minimum', 'maximum', 'clip', 'where', 'power', 'hypot'):
+    FUNCTIONS['np.' + name] = getattr(np, name)
+for name in ('sqrt', 'exp', 'log', 'log2', 'log10', 'sin', 'cos', 'tan', 'tanh', 'floor', 'ceil', 'hypot'):
+    FUNCTIONS['math.' + name] = getattr(np, name)
+FUNCTIONS.update({'math.atan': np.arctan, 'math.pow': np.power, 'math.fabs': np.abs})
+
+# random distributions, drawn once for every distance
+DISTRIBUTIONS = {'np.random.' + name: getattr(np.random, name)
+                 for name in ('normal', 'uniform', 'exponential', 'lognormal', 'gamma', 'beta', 'triangular',
+                              'binomial', 'poisson')}
+
+CONSTANTS = {'np.pi': np.pi, 'np.e': np.e, 'math.pi': np.pi, 'math.e': np.e}
+
+# Python's min and max reduce any number of arguments, numpy's elementwise versions take two
+REDUCING = {'min', 'max'}
+
+
+def dotted_name(node: ast.AST) -> str:
+    """
+    Name of a (possibly dotted) name like np.random.normal, or None if the node is something else
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = dotted_name(node.value)
+        return None if base is None else base + '.' + node.attr
+    return None
+
+
+def build(node: ast.AST, rng: np.random.Generator = None):
+    """
+    Turns a node of the expression into a function of the array of distances. Distributions are drawn
+    from rng, or from the global NumPy random state if it isn't given
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = node.value
+        return lambda dist: value
+
+    if isinstance(node, ast.Name) and node.id == 'dist':
+        return lambda dist: dist
+
+    if isinstance(node, (ast.Name, ast.Attribute)) and dotted_name(node) in CONSTANTS:
+        value = CONSTANTS[dotted_name(node)]
+        return lambda dist: value
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        function, left, right = BINARY_OPERATORS[type(node.op)], build(node.left, rng), build(node.right, rng)
+        return lambda dist: function(left(dist), right(dist))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        function, operand = UNARY_OPERATORS[type(node.op)], build(node.operand, rng)
+        return lambda dist: function(operand(dist))
+
+    if isinstance(node, ast.Compare):
+        # a < b < c is a < b and b < c
+        operands = [build(operand, rng) for operand in [node.left] + node.comparators]
+        for op in node.ops:
+            if type(op) not in COMPARISONS:
+                raise ExpressionError(f'comparison {type(op).__name__} is not allowed')
+        comparisons = [COMPARISONS[type(op)] for op in node.ops]
+
+        def compare(dist):
+            values = [operand(dist) for operand in operands]
+            result = True
+            for function, left, right in zip(comparisons, values, values[1:]):
+                result = np.logical_and(result, function(left, right))
+            return result
+        return compare
+
+    if isinstance(node, ast.BoolOp) and type(node.op) in BOOLEAN_OPERATORS:
+        function, values = BOOLEAN_OPERATORS[type(node.op)], [build(value, rng) for value in node.values]
+
+        def combine(dist):
+            result = values[0](dist)
+            for value in values[1:]:
+                result = function(result, value(dist))
+            return result
+        return combine
+
+    if isinstance(node, ast.IfExp):
+        # like Python, only the chosen branch is evaluated at every distance, so that it can guard an
+        # index or a division
+        test, body, orelse = build(node.test, rng), build(node.body, rng), build(node.orelse, rng)
+
+        def choose(dist):
+            condition = np.broadcast_to(np.asarray(test(dist), dtype=bool), np.shape(dist))
+            if condition.ndim == 0:
+                return body(dist) if condition else orelse(dist)
+            result = np.empty(np.shape(dist))
+            for mask, branch in ((condition, body), (~condition, orelse)):
+                if mask.any():
+                    result[mask] = np.broadcast_to(branch(dist[mask]), (np.count_nonzero(mask), ))
+            return result
+        return choose
+
+    if isinstance(node, ast.Subscript):
+        # only lists of constants can be indexed, with an integer valued expression
+        if not isinstance(node.value, (ast.List, ast.Tuple)) or \
+                not all(isinstance(item, ast.Constant) and isinstance(item.value, (int, float))
+                        for item in node.value.elts):
+            raise ExpressionError('only lists of numbers can be indexed')
+        table = np.array([item.value for item in node.value.elts], dtype=float)
+        # before Python 3.9, the index is wrapped in an ast.Index
+        index = build(node.slice.value if isinstance(node.slice, getattr(ast, 'Index', ())) else node.slice, rng)
+
+        def lookup(dist):
+            i = np.asarray(index(dist))
+            if not np.all(i == np.round(i)):
+                raise ExpressionError('list indices must be integers')
+            if not np.all((-len(table) <= i) & (i < len(table))):
+                raise ExpressionError('list index out of range')
+            return table[i.astype(np.intp)]
+        return lookup
+
+    if isinstance(node, ast.Call):
+        name = dotted_name(node.func)
+        if name not in FUNCTIONS and name not in DISTRIBUTIONS:
+            raise ExpressionError(f'function {name or type(node.func).__name__} is not allowed')
+        if node.keywords:
+            raise ExpressionError('keyword arguments are not allowed')
+        arguments = [build(argument, rng) for argument in node.args]
+
+        if name in REDUCING:
+            if len(arguments) < 2:
+                raise ExpressionError(f'{name} needs at least two arguments')
+            function = FUNCTIONS[name]
+
+            def reduce(dist):
+                result = arguments[0](dist)
+                for argument in arguments[1:]:
+                    result = function(result, argument(dist))
+                return result
+            return reduce
+
+        if name in FUNCTIONS:
+            function = FUNCTIONS[name]
+            return lambda dist: function(*[argument(dist) for argument in arguments])
+
+        distribution = DISTRIBUTIONS[name] if rng is None else getattr(rng, name.rpartition('.')[2])
+
+        def draw(dist):
+            values = [argument(dist) for argument in arguments]
+            # a separate draw for every distance, as if the expression was evaluated once for each
+            return distribution(*values, size=np.broadcast(dist, *values).shape)
+        return draw
+
+    raise ExpressionError(f'{type(node).__name__} is not allowed')
+
+
+def parse_expression(text: str) -> ast.expr:
+    """
+    Parses an infection chance expression, without a leading 'lambda dist:'
+
+    Raises
+    ------
+    ExpressionError
+        If the text isn't a valid expression, or the function has an argument other than dist
+    """
+    text = text.strip()
+    if text.startswith('lambda'):
+        head, _, body = text.partition(':')
+        if head.split() != ['lambda', 'dist']:
+            raise ExpressionError('the only argument of the function should be dist')
+        text = body.strip()
+    try:
+        return ast.parse(text, mode='eval').body
+    except SyntaxError as error:
+        raise ExpressionError(f'invalid expression: {error.msg}') from None
+
+
+def is_random(text: str) -> bool:
+    """
+    Whether an expression draws from a distribution, so that it gives a different value every time it
+    is evaluated. Text that isn't a valid expression isn't random
+    """
+    try:
+        tree = parse_expression(text)
+    except ExpressionError:
+        return False
+    return any(isinstance(node, ast.Call) and dotted_name(node.func) in DISTRIBUTIONS for node in ast.walk(tree))
+
+
+def canonical_expression(text: str) -> str:
+    """
+    Text that is the same for expressions that only differ in spacing, redundant parentheses or a
+    leading 'lambda dist:'. Text that isn't a valid expression is only stripped
+    """
+    try:
+        return ast.dump(parse_expression(text))
+    except ExpressionError:
+        return text.strip()
+
+
+def compile_expression(text: str, rng: np.random.Generator = None):
+    """
+    Compiles an infection chance expression of the distance `dist`
+
+    Parameters
+    ----------
+    text : str
+        The expression. A leading 'lambda dist:' is ignored, for parameters written for eval
+    rng : np.random.Generator, optional
+        Generator distributions are drawn from, instead of the global NumPy random state
+
+    Returns
+    -------
+    function
+        Function of an array of distances that returns an array of the same shape with the value of
+        the expression at every distance
+
+    Raises
+    ------
+    ExpressionError
+        If the text isn't a valid expression, or uses something other than dist, numbers, arithmetic,
+        comparisons, conditional expressions, indexing lists of numbers and the allowed functions
+    """
+    expression = build(parse_expression(text), rng)
+
+    def evaluate(dist):
+        dist = np.asarray(dist, dtype=float)
+        return np.broadcast_to(np.asarray(expression(dist), dtype=float), dist.shape).copy()
+    return evaluate
@@ -5,15 +5,13 @@ from tkinter import messagebox
 from tkinter import ttk
 from multiprocessing import Process, Manager, freeze_support
 try:
-    from static_run import static_run
-    from dynamic_run import dynamic_run
     from documentation import documentation as docs
     from simulation_parameters import DEFAULT_PARAMS, sanity_check
+    from job_manager import JobManager
 except ImportError:
-    from InfectionSimulation.static_run import static_run
-    from InfectionSimulation.dynamic_run import dynamic_run
     from InfectionSimulation.documentation import documentation as docs
     from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS, sanity_check
+    from InfectionSimulation.job_manager import JobManager
 
 if sys.version_info[0] == 3 and sys.version_info[1] >= 8 and sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -24,7 +22,8 @@ class InfectionApp(tk.Frame):
         super().__init__(master)
         self.winfo_toplevel().title('Infection Simulation')
         self.entries = {}
-        self.active_process = None
+        self.active_process = None  # process of the dynamic run
+        self.job_manager = JobManager()     # static runs, which can be queued and run concurrently
         self.available_row = 0
         self.params = Manager().dict(DEFAULT_PARAMS)
         self.create_ui()
@@ -81,6 +80,7 @@ class InfectionApp(tk.Frame):
 
         self.create_horizontal_pair("Data Collection Frequency", 4)
         self.create_horizontal_pair("Max Iterations", 4)
+        self.create_horizontal_pair("Seed", 4)
         self.update_entries()
         self.update_params()
 
@@ -90,13 +90,24 @@ class InfectionApp(tk.Frame):
         tk.Label(self.master, text="Always run Stop Simulation before changing any parameters")\
             .grid(column=1, row=self.available_row, columnspan=5)
         self.available_row += 1
+        tk.Label(self.master, text="Static runs are queued with the current parameters, "
+                                   "and save their data to run_data_<job>.csv")\
+            .grid(column=1, row=self.available_row, columnspan=5)
+        self.available_row += 1
 
-        tk.Button(text="Dynamic Run", command=lambda: self.run_button(dynamic_run))\
+        tk.Button(text="Dynamic Run", command=lambda: self.run_button(static=False))\
             .grid(column=1, row=self.available_row, columnspan=2)
         tk.Button(text="Stop Simulation", command=self.stop_current_simulation)\
             .grid(column=3, row=self.available_row)
-        tk.Button(text="Static Run", command=lambda: self.run_button(static_run))\
+        tk.Button(text="Static Run", command=lambda: self.run_button(static=True))\
             .grid(column=4, row=self.available_row, columnspan=2)
+        self.available_row += 1
+
+        self.jobs = tk.Listbox(self.master, height=5)
+        self.jobs.grid(column=1, row=self.available_row, columnspan=4, sticky='ew', padx=14)
+        tk.Button(text="Cancel Job", command=self.cancel_selected_job)\
+            .grid(column=5, row=self.available_row)
+        self.available_row += 1
         self.configure_grid()
 
     def create_horizontal_pair(self, name: str, col: int, increment_row: bool = True):
@@ -144,19 +155,59 @@ class InfectionApp(tk.Frame):
                     continue
         self.params["show_grid"] = bool(self.show_grid.get())
         self.params["has_recovery_immunity"] = bool(self.has_recovery_immunity.get())
-        self.params['infection_chance_function'] = 'lambda dist: ' + self.infection_chance_function.get(0., tk.END)
+        self.params['infection_chance_function'] = self.infection_chance_function.get(0., tk.END).strip()
 
-    def stop_current_simulation(self):
+    def stop_dynamic_run(self):
         if self.active_process is not None:
             self.active_process.terminate()
+            self.active_process.join()
+            self.active_process = None
+
+    def stop_current_simulation(self):
+        self.stop_dynamic_run()
+        self.job_manager.cancel_all()
+        self.show_jobs()
 
-    def run_button(self, command):
+    def run_button(self, static: bool):
         self.update_params()
         sanity_check(self.params)
-        self.stop_current_simulation()
 
-        self.active_process = Process(target=command, args=(self.params, ))
-        self.active_process.start()
+        if static:
+            polling = self.job_manager.active()
+            self.job_manager.submit(self.params)
+            self.show_jobs()
+            if not polling:
+                self.after(500, self.poll_jobs)
+        else:
+            # the visualization server is only imported when it is used, so that starting the GUI (and
+            # every worker process that imports it) stays fast
+            try:
+                from dynamic_run import dynamic_run
+            except ImportError:
+                from InfectionSimulation.dynamic_run import dynamic_run
+            # only one dynamic run can serve the visualization
+            self.stop_dynamic_run()
+            self.active_process = Process(target=dynamic_run, args=(self.params, ))
+            self.active_process.start()
+
+    def poll_jobs(self):
+        self.job_manager.poll()
+        self.show_jobs()
+        if self.job_manager.active():
+            self.after(500, self.poll_jobs)
+
+    def show_jobs(self):
+        selection = self.jobs.curselection()
+        self.jobs.delete(0, tk.END)
+        for job in self.job_manager.jobs:
+            self.jobs.insert(tk.END, job.describe())
+        for index in selection:
+            self.jobs.selection_set(index)
+
+    def cancel_selected_job(self):
+        for index in self.jobs.curselection():
+            self.job_manager.cancel(self.job_manager.jobs[index])
+        self.show_jobs()
 
     def configure_grid(self):
         for i in range(1, 6):
@@ -0,0 +1,155 @@
+"""
+Queue of static runs executed concurrently in worker processes
+"""
+import os
+from multiprocessing import Process
+try:
+    from static_run import static_run, cached_run
+    from shared_state import SharedState, STEP, FINISHED
+except ImportError:
+    from InfectionSimulation.static_run import static_run, cached_run
+    from InfectionSimulation.shared_state import SharedState, STEP, FINISHED
+
+
+class Job:
+    """
+    A queued static run. Its parameters are copied when it is submitted, so later changes in the
+    GUI don't affect it
+    """
+
+    def __init__(self, job_id: int, params: dict, output: str):
+        self.id = job_id
+        self.params = params
+        self.output = output
+        self.status = 'queued'      # queued, running, finished, failed or cancelled
+        self.process = None
+        self.shared_state = None    # shared memory the progress of the run is read from
+        self.step = 0
+        self.latest = None
+        self.cached = False         # whether the data was loaded from the run cache
+
+    def describe(self) -> str:
+        """
+        One line summary of the job and its progress
+        """
+        text = f"Job {self.id}: {self.status}"
+        if self.status != 'queued':
+            text += f", step {self.step} / {self.params['max_iterations']}"
+        if self.latest is not None:
+            text += f" | infected: {self.latest['infected']}, alive: {self.latest['alive']}"
+        if self.status == 'finished':
+            text += f" -> {self.output}"
+        if self.cached:
+            text += " (cached)"
+        return text
+
+
+class JobManager:
+    """
+    Runs submitted parameter sets as static runs, at most max_workers at a time. Every job mirrors its
+    progress into its own SharedState and writes its data to its own csv file.
+    `poll` has to be called periodically (for example from the tkinter event loop) to start queued
+    jobs and collect finished ones
+    """
+
+    def __init__(self, max_workers: int = None, output_pattern: str = 'run_data_{id}.csv'):
+        """
+        Parameters
+        ----------
+        max_workers : int, optional
+            Maximum number of runs at the same time, defaults to the number of cores
+        output_pattern : str
+            Path of the csv file of every job, formatted with its id
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.output_pattern = output_pattern
+        self.jobs = []
+
+    def submit(self, params: dict) -> Job:
+        """
+        Queues a run with a copy of the given parameters. If the run is in the run cache, its data is
+        saved right away and the job is finished without starting a process
+
+        Parameters
+        ----------
+        params : dict
+            Simulation parameters, which should have passed sanity_check
+
+        Returns
+        -------
+        Job
+            The queued job
+        """
+        job_id = len(self.jobs) + 1
+        params = dict(params)
+        if params['telemetry_port'] != -1:
+            # concurrent runs can't serve on the same port, so every job gets its own
+            params['telemetry_port'] += job_id - 1
+        if params['tracing_file']:
+            stem, extension = os.path.splitext(params['tracing_file'])
+            params['tracing_file'] = f'{stem}_{job_id}{extension}'
+        job = Job(job_id, params, self.output_pattern.format(id=job_id))
+        self.jobs.append(job)
+        data = cached_run(params)
+        if data is not None:
+            data.to_csv(job.output)
+            job.status = 'finished'
+            job.cached = True
+            job.step = int(data.index[-1]) + 1
+            job.latest = data.iloc[-1].to_dict()
+        self.poll()
+        return job
+
+    def running(self) -> list:
+        return [job for job in self.jobs if job.status == 'running']
+
+    def poll(self):
+        """
+        Updates the progress of running jobs, collects finished ones and starts queued jobs while
+        fewer than max_workers are running
+        """
+        for job in self.running():
+            self.update_progress(job)
+            if not job.process.is_alive():
+                job.process.join()
+                job.status = 'finished' if job.process.exitcode == 0 and job.shared_state.progress[FINISHED] \
+                    else 'failed'
+                self.release(job)
+
+        free = self.max_workers - len(self.running())
+        for job in [job for job in self.jobs if job.status == 'queued'][:max(free, 0)]:
+            job.shared_state = SharedState.create(job.params)
+            job.process = Process(target=static_run, args=(job.params, job.shared_state.layout, job.output))
+            job.process.start()
+            job.status = 'running'
+
+    def update_progress(self, job: Job):
+        job.step = int(job.shared_state.progress[STEP])
+        job.latest = job.shared_state.latest()
+
+    def release(self, job: Job):
+        if job.shared_state is not None:
+            job.shared_state.close()
+            job.shared_state = None
+
+    def cancel(self, job: Job):
+        """
+        Stops a job if it is running, and removes it from the queue if it isn't
+        """
+        if job.status == 'running':
+            job.process.terminate()
+            job.process.join()
+            self.update_progress(job)
+            self.release(job)
+        if job.status in ('queued', 'running'):
+            job.status = 'cancelled'
+
+    def cancel_all(self):
+        for job in self.jobs:
+            self.cancel(job)
+
+    def active(self) -> bool:
+        """
+        Whether any job is queued or running
+        """
+        return any(job.status in ('queued', 'running') for job in self.jobs)
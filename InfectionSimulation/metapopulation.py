@@ -0,0 +1,306 @@
+"""
+Metapopulation mode: several regions, each an InfectionModel with its own grid, linked by a sparse
+travel matrix. Agents travel between regions in batches every travel_interval steps
+"""
+from multiprocessing import Pipe, Process
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+try:
+    from model import InfectionModel
+    from collector import ArrayDataCollector
+    from utility import InfectionState, STATISTICS
+    from simulation_parameters import region_params
+except ImportError:
+    from InfectionSimulation.model import InfectionModel
+    from InfectionSimulation.collector import ArrayDataCollector
+    from InfectionSimulation.utility import InfectionState, STATISTICS
+    from InfectionSimulation.simulation_parameters import region_params
+
+
+def travel_matrix(params: dict) -> csr_matrix:
+    """
+    Sparse matrix of the probability that an agent travels from region i to region j in a batch, built
+    from the hourly rates in params['travel_rates']
+    """
+    regions = len(params['regions'])
+    rates = np.array(params['travel_rates'], dtype=float).reshape(-1, 3)
+    sources, targets = rates[:, 0].astype(int), rates[:, 1].astype(int)
+    # probability of travelling at least once in the hours of a batch
+    chances = 1 - (1 - rates[:, 2]) ** params['travel_interval']
+    return csr_matrix((chances, (sources, targets)), shape=(regions, regions))
+
+
+def region_seed(seed: int, region: int):
+    """
+    Seed of a region, derived from the seed of the run and the index of the region. None without seed
+    """
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([seed, region]).generate_state(1)[0])
+
+
+class RegionGroup:
+    """
+    Some of the regions, stepped together in one process
+    """
+
+    def __init__(self, params: dict, indices: list, seed: int = None):
+        """
+        Parameters
+        ----------
+        params : dict
+            Simulation parameters, with the regions
+        indices : list
+            Indices of the regions in this group
+        seed : int, optional
+            Seed the seeds of the regions are derived from, so that regions don't draw the same
+            numbers and seeded runs can be reproduced
+        """
+        self.indices = list(indices)
+        # every region is seeded before its agents are created
+        self.models = [InfectionModel(region_params(params, i), seed=region_seed(seed, i)) for i in self.indices]
+        self.travel = travel_matrix(params)
+
+    def advance(self, arrivals: dict, travel: bool):
+        """
+        Adds arriving agents to their regions and steps every region once
+
+        Parameters
+        ----------
+        arrivals : dict
+            Maps region index to a list of travellers arriving in it, as returned by departures
+        travel : bool
+            Whether agents leave their regions after this step
+
+        Returns
+        -------
+        tuple
+            (statistics, departures, running): the statistics of every region of the group, the
+            travellers leaving as a list of (target region, traveller), and whether any region is running
+        """
+        for index, model in zip(self.indices, self.models):
+            for traveller in arrivals.get(index, ()):
+                arrive(model, traveller)
+            model.step()
+
+        departures = []
+        if travel:
+            for index, model in zip(self.indices, self.models):
+                departures.extend(depart(model, self.travel, index))
+        statistics = {index: dict(model.statistics) for index, model in zip(self.indices, self.models)}
+        return statistics, departures, any(model.running for model in self.models)
+
+    def statistics(self) -> dict:
+        """
+        The statistics of every region of the group at its current step, also between collections
+        """
+        for model in self.models:
+            model.calculate_statistics()
+        return {index: dict(model.statistics) for index, model in zip(self.indices, self.models)}
+
+    def close(self):
+        """
+        Closes the infection logs of the regions
+        """
+        for model in self.models:
+            if model.tracer is not None:
+                model.tracer.close()
+
+
+def depart(model: InfectionModel, travel: csr_matrix, index: int) -> list:
+    """
+    Removes the agents of a region that travel in this batch. The number of agents travelling to every
+    target is drawn from a multinomial distribution, and the travellers are a random subset of the agents
+
+    Returns
+    -------
+    list
+        (target region, traveller) for every travelling agent, where the traveller is the picklable
+        tuple (state value, infection_duration, recovered_duration, age group, mobility class)
+    """
+    start, end = travel.indptr[index], travel.indptr[index + 1]
+    if start == end:
+        return []
+    targets, chances = travel.indices[start:end], travel.data[start:end]
+    agents = model.schedule.agents
+    counts = np.random.multinomial(len(agents), np.append(chances, max(0., 1 - chances.sum())))[:-1]
+    chosen = np.random.permutation(len(agents))[:counts.sum()]
+    departures = []
+    columns = model.attributes.columns
+    for target, i in zip(np.repeat(targets, counts).tolist(), chosen.tolist()):
+        agent = agents[i]
+        departures.append((target, (agent.state.value, agent.infection_duration, agent.recovered_duration,
+                                    int(columns['age_group'][agent.row]), int(columns['mobility_class'][agent.row]))))
+    for i in chosen.tolist():
+        model.remove_agent(agents[i])
+    return departures
+
+
+def arrive(model: InfectionModel, traveller: tuple):
+    """
+    Adds a traveller to a region, at a random position. It keeps its age group and mobility class
+    """
+    state, infection_duration, recovered_duration, age_group, mobility_class = traveller
+    agent = model.create_agent(InfectionState(state))
+    agent.infection_duration = infection_duration
+    agent.recovered_duration = recovered_duration
+    model.attributes.columns['age_group'][agent.row] = age_group
+    model.attributes.columns['mobility_class'][agent.row] = mobility_class
+    model.add_agent(agent, (model.random.randrange(model.grid.width), model.random.randrange(model.grid.height)))
+
+
+def region_worker(connection, params: dict, indices: list, seed: int):
+    """
+    Body of a worker process, which steps a group of regions whenever the main process asks it to
+    and sends back their results, or their statistics when it receives 'statistics', until it receives None
+    """
+    group = RegionGroup(params, indices, seed)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        if message == 'statistics':
+            connection.send(group.statistics())
+        else:
+            connection.send(group.advance(*message))
+    group.close()
+    connection.close()
+
+
+class MetapopulationModel:
+    """
+    Runs every region of params['regions'], in this process or split across params['region_workers']
+    worker processes. Travellers are exchanged through the main process between steps, so regions
+    never share memory. Keeps the combined statistics of all regions in dataCollector, and the
+    statistics of every region in region_collectors
+    """
+
+    def __init__(self, params: dict, shared_state=None, telemetry=None, seed: int = None):
+        """
+        Parameters
+        ----------
+        params: dict
+            Simulation parameters, with at least one region
+        shared_state: SharedState, optional
+            Shared memory blocks the progress and combined statistics are mirrored into
+        telemetry: TelemetryServer, optional
+            Server that the combined statistics are published to every step
+        seed: int, optional
+            Seed for the random number generators, so that runs can be reproduced
+        """
+        self.params = params
+        self.shared_state = shared_state
+        self.telemetry = telemetry
+        self.step_count = 0
+        self.running = True
+        self.statistics = {name: 0 for name in STATISTICS}
+        self.arrivals = {}
+        regions = len(params['regions'])
+        collector_args = (STATISTICS, params['collection_change_threshold'], params['collection_quiet_interval'],
+                          params['collection_max_rows'])
+        self.dataCollector = ArrayDataCollector(*collector_args)
+        self.region_collectors = [ArrayDataCollector(*collector_args) for _ in range(regions)]
+
+        self.group = None
+        self.workers = []
+        if params['region_workers'] == 0:
+            self.group = RegionGroup(params, range(regions), seed)
+        else:
+            seeds = np.random.SeedSequence(seed).generate_state(params['region_workers'])
+            for worker, indices in enumerate(np.array_split(np.arange(regions), params['region_workers'])):
+                connection, worker_connection = Pipe()
+                process = Process(target=region_worker,
+                                  args=(worker_connection, params, indices.tolist(), int(seeds[worker])),
+                                  daemon=True)
+                process.start()
+                self.workers.append((process, connection, set(indices.tolist())))
+
+    def step(self):
+        """
+        Steps every region once, then moves the travellers of this batch
+        """
+        travel = (self.step_count + 1) % self.params['travel_interval'] == 0
+        if self.group is not None:
+            results = [self.group.advance(self.arrivals, travel)]
+        else:
+            # every worker gets the travellers arriving in its regions, and steps them in parallel
+            for process, connection, indices in self.workers:
+                connection.send(({index: travellers for index, travellers in self.arrivals.items()
+                                  if index in indices}, travel))
+            results = [connection.recv() for process, connection, indices in self.workers]
+
+        self.arrivals = {}
+        region_statistics = {}
+        self.running = False
+        for statistics, departures, running in results:
+            region_statistics.update(statistics)
+            for target, traveller in departures:
+                self.arrivals.setdefault(target, []).append(traveller)
+            self.running |= running
+        # travellers are on their way until the next step, and may carry the infection with them
+        self.running |= bool(self.arrivals)
+
+        if self.step_count % self.params['data_collection_frequency'] == 0:
+            for name in STATISTICS:
+                self.statistics[name] = sum(statistics[name] for statistics in region_statistics.values())
+            self.dataCollector.collect(self)
+            for index, collector in enumerate(self.region_collectors):
+                collector.collect(RegionView(region_statistics[index], self.step_count))
+            if self.shared_state is not None:
+                self.shared_state.record_statistics(self)
+
+        self.step_count += 1
+        if self.shared_state is not None:
+            self.shared_state.record_step(self)
+        if self.telemetry is not None:
+            self.telemetry.publish(self)
+
+    def finish_collection(self):
+        """
+        Records the combined statistics and the statistics of every region at the last step once the
+        simulation stopped, if they weren't collected at it
+        """
+        if self.group is not None:
+            region_statistics = self.group.statistics()
+        else:
+            for process, connection, indices in self.workers:
+                connection.send('statistics')
+            region_statistics = {}
+            for process, connection, indices in self.workers:
+                region_statistics.update(connection.recv())
+        for name in STATISTICS:
+            self.statistics[name] = sum(statistics[name] for statistics in region_statistics.values())
+        if self.dataCollector.finish(self) and self.shared_state is not None:
+            self.shared_state.record_statistics(self)
+        for index, collector in enumerate(self.region_collectors):
+            collector.finish(RegionView(region_statistics[index], self.step_count))
+
+    def get_region_vars_dataframe(self) -> pd.DataFrame:
+        """
+        Returns the collected statistics of every region, with a region column, indexed by step
+        """
+        return pd.concat([collector.get_model_vars_dataframe().assign(region=index)
+                          for index, collector in enumerate(self.region_collectors)])
+
+    def close(self):
+        """
+        Stops the worker processes, or closes the regions of this process
+        """
+        if self.group is not None:
+            self.group.close()
+        for process, connection, indices in self.workers:
+            connection.send(None)
+            connection.close()
+            process.join()
+        self.workers = []
+
+
+class RegionView:
+    """
+    The statistics of a region at a step, in the form collectors read them from models
+    """
+
+    def __init__(self, statistics: dict, step_count: int):
+        self.statistics = statistics
+        self.step_count = step_count
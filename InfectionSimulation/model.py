@@ -1,14 +1,26 @@
+import random
 from typing import Tuple
+import numpy as np
 from mesa import Agent, Model
-from mesa.space import MultiGrid
 from mesa.time import SimultaneousActivation
-from mesa.datacollection import DataCollector
 try:
     from agent import PersonAgent
-    from utility import InfectionState
+    from attributes import AgentAttributes
+    from bulk_grid import BulkMultiGrid
+    from collector import ArrayDataCollector
+    from expression import compile_expression, is_random
+    from tracing import InfectionTracer
+    from utility import InfectionState, STATISTICS, distance_kernel
+    import simulation_parameters
 except ImportError:
     from InfectionSimulation.agent import PersonAgent
-    from InfectionSimulation.utility import InfectionState
+    from InfectionSimulation.attributes import AgentAttributes
+    from InfectionSimulation.bulk_grid import BulkMultiGrid
+    from InfectionSimulation.collector import ArrayDataCollector
+    from InfectionSimulation.expression import compile_expression, is_random
+    from InfectionSimulation.tracing import InfectionTracer
+    from InfectionSimulation.utility import InfectionState, STATISTICS, distance_kernel
+    from InfectionSimulation import simulation_parameters
 
 
 # noinspection PyMissingConstructor
@@ -17,46 +29,65 @@ class InfectionModel(Model):
     Mesa model class that simulates infection spread
     """
 
-    def __init__(self, params: dict):
+    def __init__(self, params: dict, shared_state=None, telemetry=None, seed: int = None):
         """
         Parameters
         ----------
         params: dict
             Simulation parameters
+        shared_state: SharedState, optional
+            Shared memory blocks the progress of the simulation is mirrored into, so that other
+            processes can follow it
+        telemetry: TelemetryServer, optional
+            Server that aggregated statistics are published to every step
+        seed: int, optional
+            Seed for the random number generators, so that runs can be reproduced
         """
+        # agents draw from the model's generator, movement and distributions from numpy's. mesa keeps the
+        # generator on the class, so every model gets its own, which several regions can't share
+        self.random = random.Random(seed)
+        if seed is not None:
+            np.random.seed(seed)
         self.current_id = 0     # inherited variable, for id generation
         self.params = params    # parameters
-        self.statistics = {     # statistics for data collector
-            "infected": 0,
-            "recovered": 0,
-            "susceptible": 0,
-            "vaccinated": 0,
-            "deaths": 0,
-            "alive": 0,
-            "total_infections": 0,
-            "total_recoveries": 0,
-        }
-
-        self.grid = MultiGrid(self.params['grid_width'], self.params['grid_height'], True)  # grid that agents move on
+        self.statistics = {name: 0 for name in STATISTICS}  # statistics for data collector
+        self.shared_state = shared_state
+        self.telemetry = telemetry
+
+        # age group and mobility class of every agent, by agent.row
+        self.attributes = AgentAttributes(self.params, self.params['num_agents'])
+        # group parameters of every agent by row, looked up for all agents at the start of every step
+        self.susceptibility, self.mortality_rate, self.vaccination_rate = [], [], []
+        self.grid = BulkMultiGrid(self.params['grid_width'], self.params['grid_height'])  # grid that agents move on
         self.schedule = SimultaneousActivation(self)    # scheduler for iterations of the simulation
-        self.dataCollector = DataCollector(model_reporters={    # to collect data for the graph
-            "infected": lambda m: m.statistics["infected"],
-            "recovered": lambda m: m.statistics["recovered"],
-            "susceptible": lambda m: m.statistics["susceptible"],
-            "vaccinated": lambda m: m.statistics["vaccinated"],
-            "deaths": lambda m: m.statistics["deaths"],
-            "alive": lambda m: m.statistics["alive"],
-            "total_infections": lambda m: m.statistics["total_infections"],
-            "total_recoveries": lambda m: m.statistics["total_recoveries"],
-        })
+        self.dataCollector = ArrayDataCollector(     # to collect data for the graph
+            STATISTICS, self.params['collection_change_threshold'], self.params['collection_quiet_interval'],
+            self.params['collection_max_rows'])
+        # records who infected whom, if enabled
+        self.tracer = InfectionTracer(self.params['tracing_file']) if self.params['tracing_file'] else None
+
+        # distances to the cells within infection radius, and infection chance at each of them,
+        # calculated once instead of for every pair of agents. A random infection chance is instead drawn
+        # again for every contact, with the function in random_infection_chance
+        radius = self.params['infection_radius']
+        self.distance_kernel = distance_kernel(radius, self.params['grid_width'], self.params['grid_height'])
+        offsets = np.argwhere(~np.isnan(self.distance_kernel))
+        if is_random(self.params['infection_chance_function']):
+            self.random_infection_chance = compile_expression(self.params['infection_chance_function'])
+            chances = np.full(len(offsets), np.nan)
+        else:
+            self.random_infection_chance = None
+            chances = simulation_parameters.infection_chance(self.params, self.distance_kernel[tuple(offsets.T)])
+        self.infection_kernel = [(dx - radius, dy - radius, chance, self.distance_kernel[dx, dy])
+                                 for (dx, dy), chance in zip(offsets.tolist(), chances.tolist())]
 
         self.running = True                # required for visualization, tells if simulation is done
         self.dead_agents = []   # when agents die, they are added to this list to be removed
         self.step_count = 0     # number of steps completed, required for vaccination
         self.vaccination_started = False    # has vaccination started?
 
-        # creating agents
-        for _ in range(self.params['num_agents']):
+        # creating agents, with their groups drawn at once
+        for row in self.attributes.add(self.params['num_agents']).tolist():
             # initial state of this agent
             initial_state = InfectionState.INF if \
                 self.random.uniform(0, 1) < self.params['initial_infected_chance'] else InfectionState.SUS
@@ -66,7 +97,10 @@ class InfectionModel(Model):
                 self.statistics["total_infections"] += 1
             # randomise position
             pos = self.random.randrange(self.grid.width), self.random.randrange(self.grid.height)
-            self.add_agent(self.create_agent(initial_state), pos)
+            agent = self.create_agent(initial_state, row)
+            self.add_agent(agent, pos)
+            if initial_state == InfectionState.INF and self.tracer is not None:
+                self.tracer.record(0, -1, agent.unique_id, np.nan)
 
     def check_running(self):
         """
@@ -84,26 +118,45 @@ class InfectionModel(Model):
         # just to show the progress while running in console
         if self.step_count % 100 == 0:
             print(self.step_count)
+        self.lookup_attributes()    # group parameters of all agents at once
         self.per_agent_actions()  # simulate actions to be taken globally on all agents
+        self.move_agents()      # move all agents at once
         self.schedule.step()    # run step for all agents
 
         # collect data at a particular frequency
         if self.step_count % self.params['data_collection_frequency'] == 0:
             self.calculate_statistics()  # calculate statistics for data collector
             self.dataCollector.collect(self)    # collect data
+            if self.shared_state is not None:
+                self.shared_state.record(self)
 
         self.step_count += 1
+        if self.shared_state is not None:
+            self.shared_state.record_step(self)
+        if self.telemetry is not None:
+            self.telemetry.publish(self)
         # if vaccination is enabled and enough time has passed
         if not self.vaccination_started and self.params['vaccination_start'] != -1 and \
                 self.step_count > self.params['vaccination_start']:
             self.vaccination_started = True  # start vaccination
 
-        for x in self.dead_agents:  # remove dead agents
+        # remove dead agents. An agent can die of the infection and of natural causes in the same step,
+        # and is only removed once
+        for x in dict.fromkeys(self.dead_agents):
             self.remove_agent(x)
             self.statistics["deaths"] += 1   # add to death count
         self.dead_agents = []
         self.running = self.check_running()  # is the simulation still running?
 
+    def finish_collection(self):
+        """
+        Records the statistics at the last step once the simulation stopped, if they weren't collected
+        at it
+        """
+        self.calculate_statistics()
+        if self.dataCollector.finish(self) and self.shared_state is not None:
+            self.shared_state.record_statistics(self)
+
     def calculate_statistics(self):
         """
         Calculates statistics each iteration, for more efficient data collection
@@ -126,6 +179,31 @@ class InfectionModel(Model):
             elif agent.state == InfectionState.VAC:
                 self.statistics["vaccinated"] += 1
 
+    def lookup_attributes(self):
+        """
+        Looks up the group parameters of every agent, as lists indexed by agent.row that agents read
+        during the step
+        """
+        self.susceptibility = self.attributes.lookup('susceptibility').tolist()
+        self.mortality_rate = self.attributes.lookup('mortality_rate').tolist()
+        self.vaccination_rate = self.attributes.lookup('vaccination_rate').tolist()
+
+    def move_agents(self):
+        """
+        Moves every agent a random distance in a random direction, scaled by the mobility of its class.
+        The displacements of all agents are calculated as arrays, and the grid is updated in bulk
+        """
+        agents = self.schedule.agents
+        if not agents:
+            return
+        rows = np.fromiter((agent.row for agent in agents), dtype=np.int64, count=len(agents))
+        distances = simulation_parameters.movement_distance(self.params, len(agents)) * \
+            self.attributes.lookup('mobility', rows)
+        angles = np.random.uniform(0, 2 * np.pi, len(agents))
+        xs = self.attributes.xs[rows] + np.round(distances * np.cos(angles)).astype(int)
+        ys = self.attributes.ys[rows] + np.round(distances * np.sin(angles)).astype(int)
+        self.attributes.place(rows, *self.grid.move_agents(agents, xs, ys))
+
     def per_agent_actions(self):
         """
         Simulates actions to be taken on a global scale per agent
@@ -134,11 +212,13 @@ class InfectionModel(Model):
         if self.step_count % 24 != 0:
             return
         for agent in self.schedule.agent_buffer():
-            if self.random.uniform(0, 1) < self.params['external_infection_chance']:
+            if self.random.uniform(0, 1) < self.params['external_infection_chance'] * self.susceptibility[agent.row]:
                 agent.state = InfectionState.INF
                 self.statistics["total_infections"] += 1
+                if self.tracer is not None:
+                    self.tracer.record(self.step_count, -1, agent.unique_id, np.nan)
 
-    def create_agent(self, initial_state: InfectionState) -> PersonAgent:
+    def create_agent(self, initial_state: InfectionState, row: int = None, age_group: int = None) -> PersonAgent:
         """
         Creates an agent, and returns it
 
@@ -146,13 +226,19 @@ class InfectionModel(Model):
         ----------
         initial_state : InfectionState
             Initial infection state of this agent
+        row : int, optional
+            Row of the agent in the attribute table, allocated (with randomly drawn groups) if not given
+        age_group : int, optional
+            Age group of the agent if its row is allocated, drawn if not given
 
         Returns
         -------
         PersonAgent
             The agent created
         """
-        return PersonAgent(self.next_id(), self, initial_state)
+        if row is None:
+            row = int(self.attributes.add(1, age_group)[0])
+        return PersonAgent(self.next_id(), self, initial_state, row)
 
     def add_agent(self, agent: Agent, pos: Tuple[int, int]):
         """
@@ -170,6 +256,7 @@ class InfectionModel(Model):
         self.schedule.add(agent)
         # assign position
         self.grid.place_agent(agent, pos)
+        self.attributes.place(agent.row, *pos)
 
     def remove_agent(self, agent: Agent):
         """
@@ -182,3 +269,4 @@ class InfectionModel(Model):
         """
         self.grid.remove_agent(agent)
         self.schedule.remove(agent)
+        self.attributes.remove(agent.row)
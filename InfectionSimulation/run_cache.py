@@ -0,0 +1,144 @@
+"""
+Cache of the data collected by simulation runs, stored on disk and keyed by a hash of the canonical
+parameters and the seed of the run. The cache is limited in size, and the least recently used runs
+are evicted first
+"""
+import hashlib
+import json
+import numbers
+import os
+import pandas as pd
+try:
+    from expression import canonical_expression
+except ImportError:
+    from InfectionSimulation.expression import canonical_expression
+
+
+# changed whenever runs of the same parameters would give different data, to invalidate old entries
+CACHE_VERSION = 4
+# parameters that don't change the collected data
+IGNORED_PARAMS = ('show_grid', 'density_render_threshold', 'telemetry_port', 'telemetry_interval',
+                  'telemetry_block_size', 'seed', 'run_cache_directory', 'run_cache_size')
+
+
+def canonical(value):
+    """
+    Value that is the same for equal parameters written differently: numbers are floats (so 4 and 4.0
+    are the same), dicts are sorted by json and lists are canonical element by element
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, numbers.Number):
+        return float(value) + 0.     # also turns -0. into 0.
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    return str(value)
+
+
+def canonical_params(params: dict) -> dict:
+    """
+    Canonical form of the parameters that change the collected data. The infection chance function is
+    compared by its syntax tree, so spacing, parentheses and a leading 'lambda dist:' don't matter
+    """
+    result = {name: canonical(value) for name, value in params.items() if name not in IGNORED_PARAMS}
+    result['infection_chance_function'] = canonical_expression(params['infection_chance_function'])
+    return result
+
+
+def run_key(params: dict, seed: int) -> str:
+    """
+    Hash of a run, the same for equal canonical parameters and seed
+    """
+    text = json.dumps({'version': CACHE_VERSION, 'params': canonical_params(params), 'seed': int(seed)},
+                      sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class RunCache:
+    """
+    Directory of csv files, one for every cached run. Only runs with a seed are cached, since runs
+    without one can't be reproduced. The modification time of a file is the last time it was used
+    """
+
+    def __init__(self, directory: str = 'run_cache', max_bytes: int = 100 * 2 ** 20):
+        """
+        Parameters
+        ----------
+        directory : str
+            Directory the runs are stored in, created if it doesn't exist
+        max_bytes : int
+            Total size of the stored runs above which the least recently used are removed
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def for_params(params: dict):
+        """
+        Returns the cache configured in the parameters, or None if it is disabled or the run writes
+        more than its collected data (the data of regions or a tracing file), which the cache can't
+        replace
+        """
+        if not params['run_cache_directory'] or params['regions'] or params['tracing_file']:
+            return None
+        return RunCache(params['run_cache_directory'], int(params['run_cache_size'] * 2 ** 20))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.csv')
+
+    def get(self, params: dict, seed: int):
+        """
+        Returns the cached data of a run, or None if it isn't cached
+        """
+        if seed is None:
+            return None
+        path = self.path(run_key(params, seed))
+        try:
+            data = pd.read_csv(path, index_col='step')
+            os.utime(path)
+        except FileNotFoundError:   # not cached, or evicted by another process meanwhile
+            return None
+        return data
+
+    def put(self, params: dict, seed: int, data: pd.DataFrame):
+        """
+        Stores the data of a run, and evicts the least recently used runs if the cache is too large
+        """
+        if seed is None:
+            return
+        path = self.path(run_key(params, seed))
+        # written to a temporary file first, so that concurrent readers never see a partial file
+        temporary = f'{path}.{os.getpid()}.tmp'
+        data.to_csv(temporary)
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used runs until the cache is no larger than max_bytes
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.csv'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.csv'):
+                os.remove(entry.path)
@@ -3,12 +3,16 @@ from cx_Freeze import setup, Executable
 
 # Dependencies are automatically detected, but it might need
 # fine tuning.
-build_options = {'packages': ['scipy', 'numpy'], 'includes': ['numpy'], 'excludes': []}
+# only the parts of scipy that are used, freezing all of it makes the executables large and slow to start
+build_options = {'packages': ['numpy', 'scipy.special', 'scipy.sparse'], 'includes': ['numpy'], 'excludes': [],
+                 'include_files': ['DensityModule.js']}
 
 base = 'Win32GUI' if sys.platform == 'win32' else None
 
 executables = [
-    Executable('gui.py', base=base, targetName='InfectionSimulation')
+    Executable('gui.py', base=base, targetName='InfectionSimulation'),
+    # static runs from the command line, without the GUI
+    Executable('cli.py', targetName='InfectionSimulationCLI'),
 ]
 
 setup(name='Infection Simulation',
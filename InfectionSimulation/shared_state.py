@@ -0,0 +1,174 @@
+"""
+Simulation state placed in shared memory, so that other processes can follow a running simulation
+"""
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+import numpy as np
+try:
+    from utility import STATISTICS
+except ImportError:
+    from InfectionSimulation.utility import STATISTICS
+
+
+# indices into the progress block
+STEP = 0        # number of steps completed
+ROWS = 1        # number of rows of the statistics series that have been collected
+AGENTS = 2      # number of agents whose state is mirrored in the states block
+FINISHED = 3    # 1 once the simulation is over
+
+
+class SharedState:
+    """
+    Holds the statistics time series, the progress counters and the state of every agent in
+    multiprocessing.shared_memory blocks. The process that creates it (for example the GUI) passes
+    `layout` to the simulation process, which attaches to the same blocks and writes into them.
+    The creator can then read the live state through numpy views without pickling or copying.
+    """
+
+    def __init__(self, layout: dict, create: bool):
+        """
+        Parameters
+        ----------
+        layout : dict
+            Maps block name ('progress', 'series' or 'states') to a tuple (shared memory name,
+            shape, dtype string). The shared memory name is ignored when creating
+        create : bool
+            Whether the blocks should be created or attached to
+        """
+        self.owner = create
+        self.blocks = {}
+        self.arrays = {}
+        for block, (name, shape, dtype) in layout.items():
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            memory = shared_memory.SharedMemory(name=None if create else name, create=create, size=size)
+            self.blocks[block] = memory
+            self.arrays[block] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+            if create:
+                self.arrays[block].fill(0)
+
+        self.progress = self.arrays['progress']
+        self.series = self.arrays['series']
+        self.states = self.arrays['states']
+
+    @classmethod
+    def create(cls, params: dict) -> SharedState:
+        """
+        Creates the shared memory blocks, sized for the given simulation parameters
+
+        Parameters
+        ----------
+        params : dict
+            Simulation parameters
+
+        Returns
+        -------
+        SharedState
+            The created state, owning the shared memory blocks
+        """
+        # a row every data_collection_frequency steps, and one for the last step
+        rows = params['max_iterations'] // params['data_collection_frequency'] + 2
+        # the population may grow, so leave some room for births
+        capacity = 2 * params['num_agents']
+        return cls({
+            'progress': (None, (4, ), 'int64'),
+            'series': (None, (rows, len(STATISTICS)), 'int64'),
+            'states': (None, (capacity, ), 'int8'),
+        }, True)
+
+    @classmethod
+    def attach(cls, layout: dict) -> SharedState:
+        """
+        Attaches to blocks created by another process
+
+        Parameters
+        ----------
+        layout : dict
+            The layout of a SharedState created in another process
+
+        Returns
+        -------
+        SharedState
+            The attached state
+        """
+        return cls(layout, False)
+
+    @property
+    def layout(self) -> dict:
+        """
+        Picklable description of the blocks, to be passed to SharedState.attach
+        """
+        return {block: (self.blocks[block].name, array.shape, array.dtype.str)
+                for block, array in self.arrays.items()}
+
+    def record_step(self, model):
+        """
+        Records the number of completed steps of the model
+        """
+        self.progress[STEP] = model.step_count
+
+    def record(self, model):
+        """
+        Records the statistics of the model as the next row of the series, and the current state of
+        its agents. Called every time the model collects data
+        """
+        self.record_statistics(model)
+
+        # agents beyond the capacity of the states block are not mirrored
+        count = min(model.schedule.get_agent_count(), len(self.states))
+        self.states[:count] = np.fromiter((agent.state.value for agent in model.schedule.agent_buffer()),
+                                          dtype=np.int8, count=count)
+        self.progress[AGENTS] = count
+
+    def record_statistics(self, model):
+        """
+        Records the statistics of the model as the next row of the series. Models without agents of
+        their own, like MetapopulationModel, only record their statistics
+        """
+        row = self.progress[ROWS]
+        if row < len(self.series):
+            self.series[row] = [model.statistics[name] for name in STATISTICS]
+            self.progress[ROWS] = row + 1
+
+    def record_series(self, series: np.ndarray, step: int):
+        """
+        Records a whole series of statistics at once, with columns in STATISTICS order, like the data of
+        a cached run, and the number of completed steps it ends at
+        """
+        rows = min(len(series), len(self.series))
+        self.series[:rows] = series[:rows]
+        self.progress[ROWS] = rows
+        self.progress[STEP] = step
+
+    def finish(self):
+        """
+        Marks the simulation as over
+        """
+        self.progress[FINISHED] = 1
+
+    def latest(self) -> dict:
+        """
+        Returns the most recently collected statistics, or None if nothing has been collected yet
+        """
+        rows = self.progress[ROWS]
+        if rows == 0:
+            return None
+        return dict(zip(STATISTICS, self.series[rows - 1].tolist()))
+
+    def collected(self) -> np.ndarray:
+        """
+        Returns a view of the rows of the series collected so far, with columns in STATISTICS order
+        """
+        return self.series[:self.progress[ROWS]]
+
+    def close(self):
+        """
+        Releases the shared memory blocks. The owner also frees them
+        """
+        self.progress = self.series = self.states = None
+        self.arrays = {}
+        for memory in self.blocks.values():
+            memory.close()
+            if self.owner:
+                memory.unlink()
+        self.blocks = {}
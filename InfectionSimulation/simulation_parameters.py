@@ -1,5 +1,9 @@
-from scipy.stats import erlang
+import os
 import numpy as np
+try:
+    from expression import compile_expression
+except ImportError:
+    from InfectionSimulation.expression import compile_expression
 
 DEFAULT_PARAMS = {
     'infection_radius': 2,  # how far away from an individual infection can spread
@@ -36,12 +40,46 @@ DEFAULT_PARAMS = {
     'initial_infected_chance': 0.02,  # initial fraction of people infected
 
     'show_grid': True,  # whether to show the grid during dynamic visualization
+    'density_render_threshold': 2500,  # number of agents above which the grid is shown as a density heatmap
     'data_collection_frequency': 1,  # integer, at what interval to collect data
     'max_iterations': 10000,
+    # relative change of any statistic that triggers collection, 0 to collect every data_collection_frequency steps
+    'collection_change_threshold': 0.,
+    'collection_quiet_interval': 24,  # maximum number of steps between collections when nothing changes
+    'collection_max_rows': 0,  # number of collected rows at which quiet rows are downsampled, 0 for no limit
+
+    'telemetry_port': -1,  # localhost port statistics of headless runs are streamed on, -1 for none
+    'telemetry_interval': 1.,  # minimum number of seconds between two telemetry updates
+    'telemetry_block_size': 0,  # side of blocks the density grid is aggregated into, 0 for no grid
+
+    # metapopulation mode: every region is a separate grid, with its own grid_width, grid_height, num_agents
+    # and initial_infected_chance, e.g. [{'num_agents': 500}, {'num_agents': 200, 'grid_width': 30}]
+    'regions': [],  # empty for a single grid
+    'travel_rates': [],  # [source, target, hourly probability that an agent travels] for every linked pair
+    'travel_interval': 24,  # steps between two batches of travel
+    'region_workers': 0,  # number of processes regions are stepped in, 0 to step them in this one
+
+    'tracing_file': '',  # file every infection (step, infector, infectee, distance) is logged to, empty for none
+
+    # heterogeneous agents: every agent belongs to an age group and a mobility class, drawn with the fractions
+    # of the groups, except for the age group of newborns, the first. Age groups can set mortality_rate,
+    # vaccination_rate (defaults to general_vaccination_rate) and susceptibility (factor of the infection
+    # chance, 1 by default), e.g.
+    # [{'fraction': 0.8, 'mortality_rate': 0.005}, {'fraction': 0.2, 'mortality_rate': 0.05, 'susceptibility': 1.5}]
+    'age_groups': [],  # empty for a single group with the global parameters
+    # mobility classes can set mobility, the factor of the distance moved (1 by default), e.g.
+    # [{'fraction': 0.5, 'mobility': 0.25}, {'fraction': 0.5, 'mobility': 1.75}]
+    'mobility_classes': [],  # empty for a single class
+
+    'seed': -1,  # seed of the random number generators, -1 for a different run every time
+    # directory the data of seeded runs is cached in, so that identical runs are loaded instead of simulated.
+    # Empty to disable the cache
+    'run_cache_directory': 'run_cache',
+    'run_cache_size': 100.,  # megabytes the cache is limited to, the least recently used runs are evicted
 }
 
 
-def infection_chance(params: dict, dist: float):
+def infection_chance(params: dict, dist, rng: np.random.Generator = None):
     """
     Calculates infection chance for being at dist metres from an infected individual
 
@@ -49,18 +87,20 @@ def infection_chance(params: dict, dist: float):
     ----------
     params : dict
         Simulation parameters
-    dist : float
-        Distance between individuals
+    dist : float or np.ndarray
+        Distance between individuals, or array of distances
+    rng : np.random.Generator, optional
+        Generator a random infection chance is drawn from, instead of the global NumPy random state
 
     Returns
     -------
-    float
-        Probability that infection will occur
+    np.ndarray
+        Probability that infection will occur, with the shape of dist
     """
-    return eval(params['infection_chance_function'])(dist)
+    return compile_expression(params['infection_chance_function'], rng)(dist)
 
 
-def movement_distance(params: dict):
+def movement_distance(params: dict, size: int = None):
     """
     Calculates distance to move for an agent in an iterations
 
@@ -68,13 +108,25 @@ def movement_distance(params: dict):
     ----------
     params : dict
         Simulation parameters
+    size : int, optional
+        Number of agents to calculate distances for
 
     Returns
     -------
-    int
-        Distance to move
+    float or np.ndarray
+        Distance to move, or array of distances if size is given
     """
-    return np.random.normal(params['mean_distance_per_hour'], params['sd_distance_per_hour'])
+    return np.random.normal(params['mean_distance_per_hour'], params['sd_distance_per_hour'], size)
+
+
+def erlang_cdf(x, shape: float, scale: float):
+    """
+    Cumulative distribution function of the erlang distribution, which is the regularized lower
+    incomplete gamma function. scipy.special is imported on first use instead of scipy.stats, which
+    takes seconds to import in every worker process
+    """
+    from scipy.special import gammainc
+    return gammainc(shape, np.maximum(x, 0) / scale)
 
 
 def infection_end_chance(params: dict, i: int):
@@ -93,7 +145,7 @@ def infection_end_chance(params: dict, i: int):
     float
         Probability that individual will recover
     """
-    return erlang.cdf(i, params['infection_duration_shape'], scale=params['infection_duration_scale'])
+    return erlang_cdf(i, params['infection_duration_shape'], params['infection_duration_scale'])
 
 
 def recovered_end_chance(params: dict, i: int):
@@ -113,7 +165,35 @@ def recovered_end_chance(params: dict, i: int):
     float
         Probability that recovery immunity will end
     """
-    return erlang.cdf(i, params['recovered_duration_shape'], scale=params['recovered_duration_scale'])
+    return erlang_cdf(i, params['recovered_duration_shape'], params['recovered_duration_scale'])
+
+
+# parameters that can be set for every region in metapopulation mode
+REGION_PARAMS = ('grid_width', 'grid_height', 'num_agents', 'initial_infected_chance')
+
+
+def region_params(params: dict, region: int) -> dict:
+    """
+    Parameters of a region in metapopulation mode, which simulates it as a single grid
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters, with regions
+    region : int
+        Index of the region
+
+    Returns
+    -------
+    dict
+        The shared parameters, with the overrides of the region
+    """
+    parameters = {**params, **params['regions'][region], 'regions': [], 'travel_rates': [], 'region_workers': 0}
+    if params['tracing_file']:
+        # every region logs its infections to its own file
+        stem, extension = os.path.splitext(params['tracing_file'])
+        parameters['tracing_file'] = f'{stem}_{region}{extension}'
+    return parameters
 
 
 def sanity_check(params: dict):
@@ -146,8 +226,26 @@ def sanity_check(params: dict):
     assert isinstance(params['num_agents'], int)
     assert isinstance(params['initial_infected_chance'], float)
     assert isinstance(params['show_grid'], bool)
+    assert isinstance(params['density_render_threshold'], int)
     assert isinstance(params['data_collection_frequency'], int)
     assert isinstance(params['max_iterations'], int)
+    assert isinstance(params['collection_change_threshold'], float)
+    assert isinstance(params['collection_quiet_interval'], int)
+    assert isinstance(params['collection_max_rows'], int)
+    assert isinstance(params['telemetry_port'], int)
+    assert isinstance(params['telemetry_interval'], float)
+    assert isinstance(params['telemetry_block_size'], int)
+    assert isinstance(params['infection_chance_function'], str)
+    assert isinstance(params['regions'], list)
+    assert isinstance(params['travel_rates'], list)
+    assert isinstance(params['travel_interval'], int)
+    assert isinstance(params['region_workers'], int)
+    assert isinstance(params['tracing_file'], str)
+    assert isinstance(params['age_groups'], list)
+    assert isinstance(params['mobility_classes'], list)
+    assert isinstance(params['seed'], int)
+    assert isinstance(params['run_cache_directory'], str)
+    assert isinstance(params['run_cache_size'], float)
     # value checks
     assert 1 <= params['infection_radius'] < min(params['grid_width'], params['grid_height'])
     assert 0 <= params['external_infection_chance'] <= 1
@@ -168,3 +266,51 @@ def sanity_check(params: dict):
     assert 0 < params['initial_infected_chance'] < 1
     assert params['data_collection_frequency'] > 0
     assert params['max_iterations'] > 0
+    assert params['collection_change_threshold'] >= 0
+    assert params['collection_quiet_interval'] > 0
+    assert params['collection_max_rows'] == 0 or params['collection_max_rows'] >= 4
+    assert params['telemetry_port'] == -1 or 0 < params['telemetry_port'] < 65536
+    assert params['telemetry_interval'] > 0
+    assert params['telemetry_block_size'] >= 0
+    assert params['density_render_threshold'] >= 0
+    for name, allowed in (('age_groups', ('mortality_rate', 'vaccination_rate', 'susceptibility')),
+                          ('mobility_classes', ('mobility', ))):
+        groups = params[name]
+        assert len(groups) < 2 ** 15, f'too many {name}'
+        for group in groups:
+            assert isinstance(group, dict) and 'fraction' in group, f'every one of {name} should have a fraction'
+            assert set(group) <= {'fraction', *allowed}, f'{name} can only set {", ".join(allowed)}'
+            assert all(isinstance(value, (int, float)) and value >= 0 for value in group.values())
+            assert group.get('mortality_rate', 0) <= 1 and group.get('vaccination_rate', 0) <= 1
+        assert not groups or abs(sum(group['fraction'] for group in groups) - 1) < 1e-6, \
+            f'fractions of {name} should add up to 1'
+    assert -1 <= params['seed'] < 2 ** 32
+    assert params['run_cache_size'] > 0
+    # the expression should compile, and give finite chances at every distance within infection radius
+    # (raises ExpressionError if it doesn't compile)
+    radius = params['infection_radius']
+    distances = np.hypot(*np.meshgrid(np.arange(radius + 1), np.arange(radius + 1)))
+    with np.errstate(all='ignore'):
+        chances = infection_chance(params, distances)
+    assert np.all(np.isfinite(chances)), 'infection chance should be finite'
+    assert params['travel_interval'] > 0
+    assert 0 <= params['region_workers'] <= len(params['regions'])
+    if params['regions']:
+        # regions can only override some parameters, and every region should be valid on its own
+        for region in range(len(params['regions'])):
+            assert set(params['regions'][region]) <= set(REGION_PARAMS), f'region {region} sets unknown parameters'
+            sanity_check(region_params(params, region))
+        for source, target, rate in params['travel_rates']:
+            assert isinstance(source, int) and isinstance(target, int)
+            assert 0 <= source < len(params['regions']) and 0 <= target < len(params['regions']) and source != target
+            assert 0 <= rate <= 1
+        pairs = [(source, target) for source, target, rate in params['travel_rates']]
+        assert len(pairs) == len(set(pairs)), 'every pair of regions should have at most one travel rate'
+        # the chances of leaving a region in a batch can't add up to more than 1
+        leaving = np.zeros(len(params['regions']))
+        for source, target, rate in params['travel_rates']:
+            leaving[source] += 1 - (1 - rate) ** params['travel_interval']
+        assert np.all(leaving <= 1), 'travel rates of a region add up to more than 1'
+        assert params['telemetry_block_size'] == 0, 'the density grid is not available with regions'
+    else:
+        assert not params['travel_rates']
@@ -1,13 +1,171 @@
+import os
+from typing import Tuple
+import pandas as pd
 try:
     from model import InfectionModel
+    from shared_state import SharedState
+    from run_cache import RunCache
+    from utility import STATISTICS
 except ImportError:
     from InfectionSimulation.model import InfectionModel
+    from InfectionSimulation.shared_state import SharedState
+    from InfectionSimulation.run_cache import RunCache
+    from InfectionSimulation.utility import STATISTICS
 
 
-def static_run(params: dict):
-    model = InfectionModel(params)
+def create_model(params: dict, shared_state=None, telemetry=None, seed: int = None):
+    """
+    Creates the model for the given parameters, a MetapopulationModel if they have regions and an
+    InfectionModel otherwise
+    """
+    if params['regions']:
+        # imported when needed, since scipy is slow to import
+        try:
+            from metapopulation import MetapopulationModel
+        except ImportError:
+            from InfectionSimulation.metapopulation import MetapopulationModel
+        return MetapopulationModel(params, shared_state, telemetry, seed)
+    return InfectionModel(params, shared_state, telemetry, seed)
+
+
+def run_model(model, params: dict):
+    """
+    Steps the model until it stops or max_iterations is reached, then records its last step and closes
+    its infection logs and worker processes
+    """
     for i in range(params['max_iterations']):
         model.step()
         if not model.running:
             break
-    model.dataCollector.get_model_vars_dataframe().to_csv('run_data.csv', index=False)
+    model.finish_collection()
+    if params['regions']:
+        model.close()
+    elif model.tracer is not None:
+        model.tracer.close()
+
+
+def run_seed(params: dict, seed: int = None):
+    """
+    Seed of a run: the given seed, or the seed parameter. None if neither is set
+    """
+    if seed is None and params['seed'] != -1:
+        return params['seed']
+    return seed
+
+
+def cached_run(params: dict, seed: int = None):
+    """
+    Returns the cached data of a run, or None if it isn't cached or can't be
+    """
+    cache = RunCache.for_params(params)
+    return cache.get(params, run_seed(params, seed)) if cache is not None else None
+
+
+def load_or_run(params: dict, seed: int, run) -> Tuple[pd.DataFrame, bool]:
+    """
+    Loads the data of a run from the run cache if it is in it, and otherwise calls run and stores the
+    data it returns in the cache
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    seed : int
+        Seed of the run, None if it isn't seeded (and so isn't cached)
+    run : function
+        Runs the simulation, and returns the collected data
+
+    Returns
+    -------
+    tuple
+        (data, cached): the collected data, and whether it was loaded from the cache
+    """
+    cache = RunCache.for_params(params)
+    data = cache.get(params, seed) if cache is not None else None
+    if data is not None:
+        return data, True
+    data = run()
+    if cache is not None:
+        cache.put(params, seed, data)
+    return data, False
+
+
+def simulate(params: dict, seed: int = None) -> pd.DataFrame:
+    """
+    Runs the simulation without visualization or output files, and returns the collected data. Seeded
+    runs are loaded from the run cache if they are in it, and stored in it otherwise
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    seed : int, optional
+        Seed for the random number generators, so that runs can be reproduced. Defaults to the seed
+        parameter
+
+    Returns
+    -------
+    pd.DataFrame
+        Collected statistics indexed by step, as saved by static_run
+    """
+    seed = run_seed(params, seed)
+
+    def run():
+        model = create_model(params, seed=seed)
+        run_model(model, params)
+        return model.dataCollector.get_model_vars_dataframe()
+    return load_or_run(params, seed, run)[0]
+
+
+def static_run(params: dict, shared_layout: dict = None, output: str = 'run_data.csv'):
+    """
+    Runs the simulation without visualization, and saves the collected data as a csv. Seeded runs are
+    loaded from the run cache if they are in it, and stored in it otherwise
+
+    Parameters
+    ----------
+    params : dict
+        Simulation parameters
+    shared_layout : dict, optional
+        Layout of a SharedState created by the calling process, which the progress of the
+        simulation is mirrored into
+    output : str
+        Path of the csv file the collected data is saved to. In metapopulation mode, the data of every
+        region is saved next to it, with _regions appended to the name
+    """
+    shared_state = SharedState.attach(shared_layout) if shared_layout is not None else None
+    telemetry = None
+    # the shared state is finished and the telemetry stopped even if the run fails, so that the process
+    # that follows the run doesn't wait for it forever
+    try:
+        seed = run_seed(params)
+
+        def run():
+            nonlocal telemetry
+            if params['telemetry_port'] != -1:
+                try:
+                    from telemetry import TelemetryServer
+                except ImportError:
+                    from InfectionSimulation.telemetry import TelemetryServer
+                server = TelemetryServer(params['telemetry_port'], params['telemetry_interval'],
+                                         params['telemetry_block_size'])
+                server.start()
+                telemetry = server
+
+            model = create_model(params, shared_state, telemetry, seed)
+            run_model(model, params)
+            if params['regions']:
+                stem, extension = os.path.splitext(output)
+                model.get_region_vars_dataframe().to_csv(stem + '_regions' + extension)
+            return model.dataCollector.get_model_vars_dataframe()
+
+        data, cached = load_or_run(params, seed, run)
+        data.to_csv(output)
+        if cached and shared_state is not None:
+            shared_state.record_series(data[list(STATISTICS)].to_numpy(), int(data.index[-1]) + 1)
+    finally:
+        if telemetry is not None:
+            telemetry.stop()
+        if shared_state is not None:
+            shared_state.finish()
+            shared_state.close()
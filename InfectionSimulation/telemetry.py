@@ -0,0 +1,152 @@
+"""
+Lightweight endpoint that streams aggregated statistics of a running simulation, as an alternative
+to the full mesa visualization server for large headless runs
+"""
+import asyncio
+import json
+import threading
+import time
+try:
+    from utility import density_grid
+except ImportError:
+    from InfectionSimulation.utility import density_grid
+
+
+# updates are dropped for clients that have more than this many bytes waiting to be sent
+MAX_PENDING_BYTES = 1 << 20
+
+
+class TelemetryServer:
+    """
+    Streams statistics of a model as server-sent events on localhost, for example
+    `curl http://localhost:<port>`. The asyncio event loop runs on a background thread, so the
+    simulation only pays for a time check each step, and for building an update when at least one
+    client is connected and telemetry_interval seconds have passed since the previous one
+    """
+
+    def __init__(self, port: int, interval: float, block_size: int = 0, host: str = '127.0.0.1'):
+        """
+        Parameters
+        ----------
+        port : int
+            Port to listen on
+        interval : float
+            Minimum number of seconds between two updates
+        block_size : int
+            Side of the blocks of cells the density grid is aggregated into, 0 to not send it
+        host : str
+            Interface to listen on
+        """
+        self.port = port
+        self.interval = interval
+        self.block_size = block_size
+        self.host = host
+        self.clients = set()        # stream writers of the connected clients
+        self.last_publish = 0.      # time of the last update sent
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.started = threading.Event()
+        self.server = None
+        self.error = None           # exception raised while binding the port
+
+    def start(self, timeout: float = 10.):
+        """
+        Starts serving on a background thread, returning once the port is bound
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum number of seconds to wait for the port to be bound
+
+        Raises
+        ------
+        OSError
+            If the port can't be bound, for example because it is already in use
+        TimeoutError
+            If the port isn't bound within timeout
+        """
+        self.thread.start()
+        if not self.started.wait(timeout):
+            raise TimeoutError(f'telemetry server did not start on port {self.port} within {timeout} seconds')
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        """
+        Body of the background thread
+        """
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle_client, self.host, self.port))
+        except Exception as error:
+            # raised again by start, in the thread that started the server
+            self.error = error
+            self.loop.close()
+            return
+        finally:
+            self.started.set()
+        self.loop.run_forever()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answers any request with an event stream, and keeps the client until it disconnects
+        """
+        try:
+            # skip the request line and headers
+            while (await reader.readline()).strip():
+                pass
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Access-Control-Allow-Origin: *\r\n\r\n')
+            self.clients.add(writer)
+            # nothing else is expected from the client, this returns when it disconnects
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def publish(self, model):
+        """
+        Sends the current statistics of the model to all clients, if the interval has passed.
+        Called by the model every step
+        """
+        if not self.clients:
+            return
+        now = time.monotonic()
+        if now - self.last_publish < self.interval:
+            return
+        self.last_publish = now
+
+        update = {'step': model.step_count, **model.statistics}
+        if self.block_size > 0:
+            update['block_size'] = self.block_size
+            update['density'] = density_grid(model.attributes.cells(), model.grid.width,
+                                             model.grid.height, self.block_size).tolist()
+        message = b'data: ' + json.dumps(update).encode() + b'\n\n'
+        self.loop.call_soon_threadsafe(self.broadcast, message)
+
+    def broadcast(self, message: bytes):
+        """
+        Writes a message to all clients. Runs on the event loop
+        """
+        for writer in tuple(self.clients):
+            if writer.transport.get_write_buffer_size() < MAX_PENDING_BYTES:
+                writer.write(message)
+
+    def stop(self):
+        """
+        Disconnects all clients and stops the background thread
+        """
+        def shutdown():
+            for writer in tuple(self.clients):
+                writer.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(shutdown)
+        self.thread.join()
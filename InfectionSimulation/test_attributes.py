@@ -0,0 +1,46 @@
+try:
+    from attributes import AgentAttributes
+    from model import InfectionModel
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation.attributes import AgentAttributes
+    from InfectionSimulation.model import InfectionModel
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+PARAMS = dict(DEFAULT_PARAMS, age_groups=[{'fraction': 0.1}, {'fraction': 0.9}])
+
+
+def test_rows_are_freed_once():
+    attributes = AgentAttributes(PARAMS, capacity=2)
+    rows = attributes.add(3)
+    attributes.remove(rows[0])
+    attributes.remove(rows[0])
+    assert attributes.free == [rows[0]]
+    assert len(set(attributes.add(2)) | set(rows[1:])) == 4
+
+
+def test_newborns_are_in_the_youngest_age_group():
+    attributes = AgentAttributes(PARAMS)
+    assert set(attributes.columns['age_group'][attributes.add(200)]) == {0, 1}
+    assert set(attributes.columns['age_group'][attributes.add(50, age_group=0)]) == {0}
+
+
+def test_agent_dying_twice_is_removed_once():
+    model = InfectionModel(dict(PARAMS, num_agents=50), seed=1)
+    agent = next(iter(model.schedule.agents))
+    model.dead_agents.extend([agent, agent])
+    model.step()
+    assert model.statistics['deaths'] >= 1
+    assert agent.unique_id not in {other.unique_id for other in model.schedule.agents}
+    assert model.attributes.free.count(agent.row) == 1
+
+
+def test_cells_follow_the_agents():
+    model = InfectionModel(dict(PARAMS, num_agents=300, population_birth_rate=20., population_death_rate=20.,
+                                external_infection_chance=0.5), seed=2)
+    for _ in range(30):
+        model.step()
+        states, xs, ys = model.attributes.cells()
+        expected = sorted((agent.state.value, *agent.pos) for agent in model.schedule.agents)
+        assert sorted(zip(states.tolist(), xs.tolist(), ys.tolist())) == expected
@@ -0,0 +1,26 @@
+import json
+from argparse import Namespace
+import pytest
+try:
+    from cli import parse_params
+    from simulation_parameters import sanity_check
+except ImportError:
+    from InfectionSimulation.cli import parse_params
+    from InfectionSimulation.simulation_parameters import sanity_check
+
+
+def test_params_file_and_set_are_coerced_alike(tmp_path):
+    path = tmp_path / 'params.json'
+    path.write_text(json.dumps({'mortality_rate': 0, 'num_agents': 50}))
+    from_file = parse_params(Namespace(params=str(path), set=[]))
+    from_set = parse_params(Namespace(params=None, set=['mortality_rate=0', 'num_agents=50']))
+    assert from_file == from_set
+    assert isinstance(from_file['mortality_rate'], float) and isinstance(from_file['num_agents'], int)
+    sanity_check(from_file)
+
+
+def test_unknown_parameter_in_params_file(tmp_path):
+    path = tmp_path / 'params.json'
+    path.write_text(json.dumps({'foo': 1}))
+    with pytest.raises(ValueError):
+        parse_params(Namespace(params=str(path), set=[]))
@@ -0,0 +1,66 @@
+import json
+try:
+    from collector import ArrayDataCollector
+    from model import InfectionModel
+    from static_run import run_model
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation.collector import ArrayDataCollector
+    from InfectionSimulation.model import InfectionModel
+    from InfectionSimulation.static_run import run_model
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+def test_model_vars_are_json_serializable():
+    model = InfectionModel(dict(DEFAULT_PARAMS, max_iterations=10, run_cache_directory=''), seed=1)
+    for _ in range(5):
+        model.step()
+    model_vars = model.dataCollector.model_vars
+    assert len(model_vars['infected']) == 5
+    # mesa's ChartModule sends the last value of every chart to the browser as json
+    json.dumps(model_vars)
+    json.dumps({name: values[-1] for name, values in model_vars.items()})
+
+
+class Counter:
+    """
+    Stands in for a model, with a single statistic
+    """
+
+    def __init__(self):
+        self.step_count = 0
+        self.statistics = {'count': 0}
+
+
+def test_finish_records_the_last_step():
+    collector = ArrayDataCollector(('count', ), change_threshold=0.5, quiet_interval=10)
+    model = Counter()
+    for step in range(25):
+        model.step_count = step
+        model.statistics['count'] = 100 + step
+        collector.collect(model)
+    model.step_count = 25
+    assert collector.finish(model)
+    assert not collector.finish(model)
+    data = collector.get_model_vars_dataframe()
+    assert data.index.tolist() == [0, 10, 20, 24]
+    assert data['count'].iloc[-1] == 124
+
+
+def test_model_vars_are_extended_with_new_rows():
+    collector = ArrayDataCollector(('count', ), max_rows=8)
+    model = Counter()
+    lists = None
+    for step in range(20):
+        model.step_count = step
+        model.statistics['count'] = step
+        collector.collect(model)
+        lists = collector.model_vars
+        assert lists['count'] == collector.values[:collector.rows, 0].tolist()
+    assert collector.model_vars is lists
+
+
+def test_static_runs_end_with_the_last_step():
+    model = InfectionModel(dict(DEFAULT_PARAMS, data_collection_frequency=7, run_cache_directory=''), seed=1)
+    run_model(model, dict(DEFAULT_PARAMS, max_iterations=20))
+    assert model.dataCollector.get_model_vars_dataframe().index.tolist() == [0, 7, 14, 19]
@@ -0,0 +1,19 @@
+import numpy as np
+try:
+    from compartmental import kernel_chance
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation.compartmental import kernel_chance
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+def test_kernel_chance_is_reproducible():
+    np.random.seed(0)
+    state = np.random.get_state()[1].copy()
+    first = kernel_chance(DEFAULT_PARAMS)
+    np.random.random_sample(10)
+    assert kernel_chance(DEFAULT_PARAMS) == first
+    np.random.seed(0)
+    kernel_chance(DEFAULT_PARAMS)
+    assert np.array_equal(np.random.get_state()[1], state)
+    assert kernel_chance(dict(DEFAULT_PARAMS, seed=3)) != first
@@ -0,0 +1,54 @@
+import warnings
+import numpy as np
+import pytest
+try:
+    from expression import compile_expression, is_random, ExpressionError
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation.expression import compile_expression, is_random, ExpressionError
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+DISTANCES = np.array([[0., 1., 2.], [np.sqrt(2), 3., 4.]])
+
+
+def test_conditional_guards_an_index():
+    chance = compile_expression('[0.3, 0.2, 0.1][round(dist)] if dist < 2.5 else 0')
+    assert np.allclose(chance(DISTANCES), [[0.3, 0.2, 0.1], [0.2, 0, 0]])
+    with pytest.raises(ExpressionError):
+        compile_expression('[0.3, 0.2, 0.1][round(dist)]')(DISTANCES)
+
+
+def test_conditional_guards_a_division():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with np.errstate(all='raise'):
+            chance = compile_expression('0.1 / dist if dist > 0 else 0.2')(DISTANCES)
+    assert np.allclose(chance, [[0.2, 0.1, 0.05], [0.1 / np.sqrt(2), 0.1 / 3, 0.025]])
+
+
+def test_conditional_with_constant_test_and_scalar_distance():
+    assert np.allclose(compile_expression('0.1 if 1 < 2 else dist')(DISTANCES), 0.1)
+    assert compile_expression('dist if dist > 1 else 0')(3.) == 3.
+    assert compile_expression('dist if dist > 1 else 0')(0.5) == 0.
+
+
+def test_nested_conditionals_draw_only_chosen_branches():
+    chance = compile_expression('0 if dist > 3 else (np.random.uniform(0.1, 0.2) if dist > 1 else 1)')
+    values = chance(DISTANCES)
+    assert values[0, 0] == 1 and values[0, 1] == 1 and values[1, 2] == 0
+    assert np.all((values[[0, 1, 1], [2, 0, 1]] >= 0.1) & (values[[0, 1, 1], [2, 0, 1]] <= 0.2))
+
+
+def test_random_expressions():
+    assert is_random(DEFAULT_PARAMS['infection_chance_function'])
+    assert is_random('lambda dist: 0.1 if dist < 1 else np.random.uniform(0, 0.1)')
+    assert not is_random('np.exp(-dist) * 0.1')
+    assert not is_random('np.random.normal(')
+
+
+def test_distributions_are_drawn_from_a_generator():
+    chance = compile_expression('np.random.normal(0.1, 0.01)', np.random.default_rng(1))
+    assert np.array_equal(chance(DISTANCES), compile_expression('np.random.normal(0.1, 0.01)',
+                                                                 np.random.default_rng(1))(DISTANCES))
+    assert not np.array_equal(chance(DISTANCES), chance(DISTANCES))
@@ -0,0 +1,22 @@
+try:
+    from static_run import simulate
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation.static_run import simulate
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+PARAMS = dict(DEFAULT_PARAMS, max_iterations=60, travel_interval=12, run_cache_directory='', seed=4,
+              regions=[{'num_agents': 200}, {'num_agents': 150, 'grid_width': 30}, {'num_agents': 100}],
+              travel_rates=[[0, 1, 0.01], [1, 2, 0.01], [2, 0, 0.01]])
+
+
+def test_seeded_runs_are_reproducible():
+    first = simulate(PARAMS)
+    assert first.equals(simulate(PARAMS))
+    assert not first.equals(simulate(dict(PARAMS, seed=5)))
+
+
+def test_seeded_runs_with_workers_are_reproducible():
+    params = dict(PARAMS, region_workers=2)
+    assert simulate(params).equals(simulate(params))
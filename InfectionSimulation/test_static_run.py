@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+try:
+    import static_run
+    from shared_state import SharedState, FINISHED
+    from simulation_parameters import DEFAULT_PARAMS
+except ImportError:
+    from InfectionSimulation import static_run
+    from InfectionSimulation.shared_state import SharedState, FINISHED
+    from InfectionSimulation.simulation_parameters import DEFAULT_PARAMS
+
+
+def test_cached_runs_fill_the_shared_state(tmp_path):
+    params = dict(DEFAULT_PARAMS, max_iterations=30, seed=1, run_cache_directory=str(tmp_path / 'cache'))
+    static_run.static_run(params, output=str(tmp_path / 'first.csv'))
+    shared_state = SharedState.create(params)
+    try:
+        static_run.static_run(params, shared_state.layout, str(tmp_path / 'second.csv'))
+        data = pd.read_csv(tmp_path / 'first.csv', index_col='step')
+        assert shared_state.progress[FINISHED] == 1
+        assert np.array_equal(shared_state.collected(), data.to_numpy())
+        assert shared_state.latest() == data.iloc[-1].to_dict()
+    finally:
+        shared_state.close()
+
+
+def test_failed_runs_finish_the_shared_state(tmp_path, monkeypatch):
+    def fail(model, params):
+        raise RuntimeError('failed')
+    monkeypatch.setattr(static_run, 'run_model', fail)
+    params = dict(DEFAULT_PARAMS, max_iterations=30, run_cache_directory='')
+    shared_state = SharedState.create(params)
+    try:
+        with pytest.raises(RuntimeError):
+            static_run.static_run(params, shared_state.layout, str(tmp_path / 'run.csv'))
+        assert shared_state.progress[FINISHED] == 1
+    finally:
+        shared_state.close()
+
+
+def test_seeded_runs_are_loaded_from_the_cache(tmp_path):
+    params = dict(DEFAULT_PARAMS, max_iterations=30, seed=2, run_cache_directory=str(tmp_path))
+    data = static_run.simulate(params)
+
+    def run():
+        raise AssertionError('a cached run should not be simulated')
+    cached, loaded = static_run.load_or_run(params, 2, run)
+    assert loaded and np.array_equal(cached.to_numpy(), data.to_numpy())
+    # runs without a seed are never cached
+    assert not static_run.load_or_run(params, None, lambda: data)[1]
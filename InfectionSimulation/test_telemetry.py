@@ -0,0 +1,24 @@
+import socket
+import pytest
+try:
+    from telemetry import TelemetryServer
+except ImportError:
+    from InfectionSimulation.telemetry import TelemetryServer
+
+
+def test_start_raises_when_port_is_in_use():
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        server = TelemetryServer(taken.getsockname()[1], 1.)
+        with pytest.raises(OSError):
+            server.start(timeout=5.)
+        server.thread.join(5.)
+        assert not server.thread.is_alive()
+
+
+def test_start_and_stop():
+    server = TelemetryServer(0, 1.)
+    server.start()
+    server.stop()
+    assert not server.thread.is_alive()
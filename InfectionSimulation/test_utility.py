@@ -0,0 +1,55 @@
+from itertools import product
+from types import SimpleNamespace
+import numpy as np
+import pytest
+try:
+    from utility import InfectionState, density_grid, distance_kernel, toroidal_distance
+except ImportError:
+    from InfectionSimulation.utility import InfectionState, density_grid, distance_kernel, toroidal_distance
+
+
+def moore_cells(x: int, y: int, radius: int, width: int, height: int) -> set:
+    """
+    Cells within radius of (x, y) in the Moore sense on a torus, found by brute force
+    """
+    return {((x + dx) % width, (y + dy) % height)
+            for dx, dy in product(range(-radius, radius + 1), repeat=2)}
+
+
+# small grids, where the radius is at least half the width or height, and larger ones
+@pytest.mark.parametrize('radius, width, height', [
+    (1, 2, 2), (1, 3, 3), (2, 3, 5), (2, 4, 4), (3, 5, 6), (3, 4, 9), (2, 5, 7), (2, 10, 10), (4, 3, 20),
+])
+def test_distance_kernel_matches_brute_force(radius, width, height):
+    kernel = distance_kernel(radius, width, height)
+    offsets = np.argwhere(~np.isnan(kernel)) - radius
+    # every cell, including the edges and corners
+    for x, y in product(range(width), range(height)):
+        reached = [((x + dx) % width, (y + dy) % height) for dx, dy in offsets.tolist()]
+        # every cell in the neighbourhood is reached exactly once
+        assert len(reached) == len(set(reached))
+        assert set(reached) == moore_cells(x, y, radius, width, height)
+        for (dx, dy), cell in zip(offsets.tolist(), reached):
+            assert kernel[dx + radius, dy + radius] == pytest.approx(toroidal_distance((x, y), cell, width, height))
+
+
+@pytest.mark.parametrize('width, height, block_size', [(5, 7, 2), (6, 6, 3), (4, 9, 4), (3, 3, 1)])
+def test_density_grid_matches_brute_force(width, height, block_size):
+    rng = np.random.default_rng(0)
+    states = list(InfectionState)
+    # agents on the edges and corners, and random ones
+    positions = [(0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1), (width - 1, height // 2)]
+    positions += [tuple(position) for position in rng.integers((0, 0), (width, height), (50, 2)).tolist()]
+    agents = [SimpleNamespace(state=states[i % len(states)], pos=position) for i, position in enumerate(positions)]
+
+    cells = tuple(np.array(values) for values in zip(*[(agent.state.value, *agent.pos) for agent in agents]))
+    grid = density_grid(cells, width, height, block_size)
+    expected = np.zeros((len(states), -(-width // block_size), -(-height // block_size)), dtype=np.int64)
+    for agent in agents:
+        expected[agent.state.value - 1, agent.pos[0] // block_size, agent.pos[1] // block_size] += 1
+    assert np.array_equal(grid, expected)
+    assert grid.sum() == len(agents)
+
+
+def test_density_grid_without_agents():
+    assert density_grid((np.zeros(0, dtype=np.int8), ) * 3, 5, 5, 2).shape == (len(InfectionState), 3, 3)
@@ -0,0 +1,182 @@
+"""
+Recorder of who infected whom, with helpers to compute generation intervals and R_t from the log
+"""
+import struct
+import numpy as np
+
+
+# one infection: the step it happened at, the unique ids of the infector (-1 for infections from
+# outside and initially infected agents) and the infectee, and the distance between them (nan
+# without infector)
+EVENT_DTYPE = np.dtype([('step', '<i8'), ('infector', '<i8'), ('infectee', '<i8'), ('distance', '<f4')])
+
+# every block of a tracing file is a header followed by count events
+BLOCK_HEADER = struct.Struct('<4sQ')
+MAGIC = b'TRCE'
+
+
+class InfectionTracer:
+    """
+    Records infection events into a preallocated structured array. With a path, full chunks are
+    appended to the file as binary blocks, otherwise the array grows by a chunk whenever it is full
+    """
+
+    def __init__(self, path: str = None, chunk_size: int = 65536):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            File the events are flushed to, None to keep them in memory
+        chunk_size : int
+            Number of events allocated at a time, and written in a block
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = np.empty(chunk_size, dtype=EVENT_DTYPE)
+        self.count = 0  # number of events in buffer
+        self.file = open(path, 'wb') if path is not None else None
+
+    def record(self, step: int, infector: int, infectee: int, distance: float):
+        """
+        Records an infection
+        """
+        if self.count == len(self.buffer):
+            if self.file is not None:
+                self.flush()
+            else:
+                self.buffer = np.concatenate((self.buffer, np.empty(self.chunk_size, dtype=EVENT_DTYPE)))
+        self.buffer[self.count] = (step, infector, infectee, distance)
+        self.count += 1
+
+    def flush(self):
+        """
+        Writes the buffered events to the file as a block
+        """
+        if self.count > 0:
+            self.file.write(BLOCK_HEADER.pack(MAGIC, self.count))
+            self.file.write(self.buffer[:self.count].tobytes())
+            self.file.flush()
+            self.count = 0
+
+    def events(self) -> np.ndarray:
+        """
+        Returns every event recorded so far, in order
+        """
+        if self.file is None:
+            return self.buffer[:self.count]
+        self.flush()
+        return read_events(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def read_events(path: str) -> np.ndarray:
+    """
+    Reads every event of a tracing file
+
+    Parameters
+    ----------
+    path : str
+        File written by InfectionTracer
+
+    Returns
+    -------
+    np.ndarray
+        Events with EVENT_DTYPE
+    """
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if not header:
+                break
+            magic, count = BLOCK_HEADER.unpack(header)
+            assert magic == MAGIC, f'{path} is not a tracing file'
+            blocks.append(np.frombuffer(f.read(count * EVENT_DTYPE.itemsize), dtype=EVENT_DTYPE))
+    return np.concatenate(blocks) if blocks else np.empty(0, dtype=EVENT_DTYPE)
+
+
+def infector_events(events: np.ndarray) -> np.ndarray:
+    """
+    Finds, for every event, the event in which its infector was infected (the latest infection of the
+    infector at or before the step)
+
+    Parameters
+    ----------
+    events : np.ndarray
+        Events with EVENT_DTYPE, in order of step
+
+    Returns
+    -------
+    np.ndarray
+        Index into events of the infection of the infector of every event, -1 if it isn't in the log
+    """
+    if len(events) == 0:
+        return np.empty(0, dtype=np.int64)
+    # infections sorted by agent, then step
+    span = int(events['step'].max()) + 1
+    keys = events['infectee'] * span + events['step']
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    position = np.searchsorted(sorted_keys, events['infector'] * span + events['step'], side='right') - 1
+    clipped = np.maximum(position, 0)
+    # the match should be an infection of the infector itself, not the last one of another agent
+    found = (events['infector'] >= 0) & (position >= 0) & (sorted_keys[clipped] // span == events['infector'])
+    return np.where(found, order[clipped], -1)
+
+
+def generation_intervals(events: np.ndarray) -> np.ndarray:
+    """
+    Number of steps between the infection of the infector and the infection it caused, for every
+    event with a known infector
+
+    Parameters
+    ----------
+    events : np.ndarray
+        Events with EVENT_DTYPE, in order of step
+
+    Returns
+    -------
+    np.ndarray
+        Generation intervals, in steps
+    """
+    sources = infector_events(events)
+    known = sources >= 0
+    return events['step'][known] - events['step'][sources[known]]
+
+
+def reproduction_number(events: np.ndarray, window: int = 24):
+    """
+    Cohort reproduction number R_t: the mean number of infections caused by the agents infected in
+    every window of steps. The last windows are underestimated, since their infections have not run
+    their course when the log ends
+
+    Parameters
+    ----------
+    events : np.ndarray
+        Events with EVENT_DTYPE, in order of step
+    window : int
+        Number of steps in a window
+
+    Returns
+    -------
+    tuple
+        (steps, r): the first step of every window, and R_t of the window (nan if nobody was
+        infected in it)
+    """
+    if len(events) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    sources = infector_events(events)
+    # number of infections caused by every infection
+    caused = np.bincount(sources[sources >= 0], minlength=len(events))
+    windows = events['step'] // window
+    count = int(windows.max()) + 1
+    infections = np.bincount(windows, minlength=count)
+    secondary = np.bincount(windows, weights=caused, minlength=count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = secondary / infections
+    return np.arange(count) * window, np.where(infections > 0, r, np.nan)
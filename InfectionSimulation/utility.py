@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import Tuple
+import numpy as np
 
 
 class InfectionState(Enum):
@@ -12,6 +13,19 @@ class InfectionState(Enum):
     VAC = 4  # vaccinated (also immune)
 
 
+# names of the statistics the model keeps track of, in the order they are collected
+STATISTICS = (
+    "infected",
+    "recovered",
+    "susceptible",
+    "vaccinated",
+    "deaths",
+    "alive",
+    "total_infections",
+    "total_recoveries",
+)
+
+
 def sqr_toroidal_distance(a: Tuple[int, int], b: Tuple[int, int], grid_width: int, grid_height: int):
     """
     Function to get square of toroidal distance between two grid points
@@ -30,11 +44,11 @@ def sqr_toroidal_distance(a: Tuple[int, int], b: Tuple[int, int], grid_width: in
     """
     xdelta = abs(a[0] - b[0])
     if xdelta > grid_width / 2:
-        xdelta = grid_width / 2 - xdelta
+        xdelta = grid_width - xdelta
 
     ydelta = abs(a[1] - b[1])
     if ydelta > grid_height / 2:
-        ydelta = grid_height / 2 - ydelta
+        ydelta = grid_height - ydelta
     return xdelta**2 + ydelta**2
 
 
@@ -54,3 +68,70 @@ def toroidal_distance(a: Tuple[int, int], b: Tuple[int, int], grid_width: int, g
         Toroidal distance between a and b
     """
     return sqr_toroidal_distance(a, b, grid_width, grid_height) ** 0.5
+
+
+def distance_kernel(radius: int, grid_width: int, grid_height: int) -> np.ndarray:
+    """
+    Calculates the toroidal distance from a cell to every cell within radius of it (in the Moore
+    sense), for a grid of the given dimensions
+
+    Parameters
+    ----------
+    radius : int
+        Radius of the neighbourhood
+    grid_width, grid_height : int
+        Grid dimensions
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (2 * radius + 1, 2 * radius + 1), where [dx + radius, dy + radius] is the
+        distance to the cell at offset (dx, dy). If the neighbourhood wraps around a small grid
+        and an offset reaches a cell already reached by a shorter offset, its distance is nan, so
+        that every cell appears once
+    """
+    def unique_offsets(size: int) -> np.ndarray:
+        # offsets in order of increasing length, keeping the first to reach every cell
+        seen = set()
+        keep = np.zeros(2 * radius + 1, dtype=bool)
+        for offset in sorted(range(-radius, radius + 1), key=abs):
+            if offset % size not in seen:
+                seen.add(offset % size)
+                keep[offset + radius] = True
+        return keep
+
+    offsets = np.abs(np.arange(-radius, radius + 1))
+    xdelta = np.minimum(offsets, grid_width - offsets)
+    ydelta = np.minimum(offsets, grid_height - offsets)
+    kernel = np.sqrt(xdelta[:, None] ** 2 + ydelta[None, :] ** 2)
+    kernel[~unique_offsets(grid_width), :] = np.nan
+    kernel[:, ~unique_offsets(grid_height)] = np.nan
+    return kernel
+
+
+def density_grid(cells: tuple, grid_width: int, grid_height: int, block_size: int) -> np.ndarray:
+    """
+    Counts the agents in each state, per block of block_size x block_size cells
+
+    Parameters
+    ----------
+    cells : tuple
+        Arrays (states, xs, ys) of the state value and cell of every agent, as returned by
+        AgentAttributes.cells
+    grid_width, grid_height : int
+        Grid dimensions
+    block_size : int
+        Side of the square blocks of cells agents are aggregated into
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (number of states, blocks along width, blocks along height), where
+        [state.value - 1, x, y] is the number of agents in that state in block (x, y)
+    """
+    width = -(-grid_width // block_size)    # ceil division, the last block may be partial
+    height = -(-grid_height // block_size)
+    states, xs, ys = (np.asarray(array, dtype=np.int64) for array in cells)
+    flat = ((states - 1) * width + xs // block_size) * height + ys // block_size
+    counts = np.bincount(flat, minlength=len(InfectionState) * width * height)
+    return counts.reshape((len(InfectionState), width, height))
@@ -0,0 +1,123 @@
+"""
+Loads simulation parameters from TOML or JSON files, so runs can be configured without editing
+simulation_parameters.py
+
+Every key of the file must be a parameter in SCHEMA, and overrides the value in
+simulation_parameters. For example, in TOML:
+
+    side = 200
+    types_distribution = [0.5, 0.5]
+    type_colours = [[1, 0, 0], [0, 0, 1]]
+    gets_along_with = [[1, 0], [0, 1]]
+    tactic = "NearestMovement"
+"""
+import json
+import numpy as np
+import simulation_parameters as params
+import movement_tactics as tactics
+try:
+    import tomllib
+except ImportError:     # before Python 3.11
+    tomllib = None
+
+
+def integer(value):
+    assert isinstance(value, int) and not isinstance(value, bool), f'{value!r} is not an integer'
+    return value
+
+
+def number(value):
+    assert isinstance(value, (int, float)) and not isinstance(value, bool), f'{value!r} is not a number'
+    return float(value)
+
+
+def boolean(value):
+    assert isinstance(value, bool), f'{value!r} is not a boolean'
+    return value
+
+
+def string(value):
+    assert isinstance(value, str), f'{value!r} is not a string'
+    return value
+
+
+def optional_string(value):
+    return None if value is None or value == '' else string(value)
+
+
+def number_list(value):
+    array = np.asarray(value, dtype=float)
+    assert array.ndim == 1, f'{value!r} is not a list of numbers'
+    return array.tolist()
+
+
+def colour(value):
+    array = np.asarray(value, dtype=float)
+    assert array.shape == (3, ), f'{value!r} is not an RGB colour'
+    return tuple(array.tolist())
+
+
+def colour_list(value):
+    return [colour(item) for item in value]
+
+
+def matrix(value):
+    array = np.asarray(value, dtype=float)
+    assert array.ndim == 2, f'{value!r} is not a matrix'
+    return np.matrix(array)
+
+
+def tactic(value):
+    movement_tactic = getattr(tactics, string(value), None)
+    assert isinstance(movement_tactic, type) and issubclass(movement_tactic, tactics.MovementTactic), \
+        f'{value!r} is not a movement tactic'
+    return movement_tactic
+
+
+# converter of every parameter that can be configured. Converters check the type of the value read
+# from the file, and return it as simulation_parameters expects it
+SCHEMA = {
+    'side': integer,
+    'empty_fraction': number,
+    'types_distribution': number_list,
+    'type_colours': colour_list,
+    'gets_along_with': matrix,
+    'empty_colour': colour,
+    'max_iterations': integer,
+    'neighbour_amount': number,
+    'tactic': tactic,
+    'bucket_size': integer,
+    'neighbourhood': string,
+    'neighbourhood_radius': integer,
+    'torus': boolean,
+    'graph_file': optional_string,
+    'unstable_tolerance': number,
+    'memmap_file': optional_string,
+    'tile_size': integer,
+    'workers': integer,
+    'store_history': boolean,
+    'metrics_file': optional_string,
+    'history_file': optional_string,
+    'dissimilarity_block': integer,
+}
+
+
+# read a configuration file, TOML or JSON depending on its extension
+def load_config(path: str):
+    if path.endswith('.toml'):
+        assert tomllib is not None, 'TOML configuration files need Python 3.11 or later'
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+# check and convert every value of a configuration, and set it in simulation_parameters
+def apply_config(config: dict):
+    converted = {}
+    for name, value in config.items():
+        assert name in SCHEMA, f'unknown parameter {name!r}'
+        converted[name] = SCHEMA[name](value)
+    for name, value in converted.items():
+        setattr(params, name, value)
+    params.types = len(params.types_distribution)
@@ -0,0 +1,131 @@
+"""
+Compact binary file format for the history of a run, one grid per iteration that moved nodes
+
+The file starts with a header, followed by the frames and an index of them. Every frame is zlib
+compressed int8 data, either the whole grid (a keyframe) or its difference with the previous frame,
+which is almost all zeros. Keyframes are written every KEYFRAME_INTERVAL frames, so any frame can be
+decoded from the nearest keyframe before it. The index also holds the number of iterations completed
+when every frame was written, since iterations without moves don't write one. The file ends with a
+trailer that points to the index.
+
+    header:  magic, version, side (HEADER)
+    frames:  zlib streams
+    index:   one INDEX_DTYPE entry per frame
+    trailer: index offset, number of frames, magic (TRAILER)
+"""
+import struct
+import zlib
+import numpy as np
+import simulation_parameters as params
+
+
+MAGIC = b'SCHH'
+VERSION = 2
+HEADER = struct.Struct('<4sII')
+TRAILER = struct.Struct('<QQ4s')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u8'), ('keyframe', 'u1'), ('iterations', '<u8')])
+KEYFRAME_INTERVAL = 64
+
+
+class HistoryWriter:
+    """
+    Appends frames to a history file. The index is written by close, so the file can only be read
+    once the writer is closed
+    """
+
+    def __init__(self, path: str, side: int):
+        self.file = open(path, 'wb')
+        self.side = side
+        self.index = []
+        self.previous = None    # previous frame, as uint8 so differences wrap around
+        self.file.write(HEADER.pack(MAGIC, VERSION, side))
+
+    # append the grid after the given number of completed iterations
+    def append(self, frame: np.ndarray, iterations: int = 0):
+        frame = np.asarray(frame)
+        assert frame.shape == (self.side, self.side)
+        # types are stored as int8
+        assert frame.min() >= -1 and frame.max() <= 127
+        frame = frame.astype(np.int8).view(np.uint8)
+        keyframe = len(self.index) % KEYFRAME_INTERVAL == 0
+        data = frame if keyframe else frame - self.previous
+        compressed = zlib.compress(np.ascontiguousarray(data).tobytes(), 1)
+        self.index.append((self.file.tell(), len(compressed), keyframe, iterations))
+        self.file.write(compressed)
+        self.previous = frame
+
+    def close(self):
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(self.index), MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HistoryReader:
+    """
+    Reads a history file through a memory map. Frames are only decoded when they are accessed
+    """
+
+    def __init__(self, path: str):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, self.side = HEADER.unpack(self.data[:HEADER.size].tobytes())
+        assert magic == MAGIC and version == VERSION, f'{path} is not a history file'
+        index_offset, count, magic = TRAILER.unpack(self.data[-TRAILER.size:].tobytes())
+        assert magic == MAGIC, f'{path} was not closed properly'
+        self.index = self.data[index_offset:index_offset + count * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    # number of iterations completed when every frame was written
+    @property
+    def iterations(self):
+        return self.index['iterations']
+
+    # the grid after the given number of completed iterations
+    def after(self, iterations: int):
+        i = int(np.searchsorted(self.iterations, iterations, side='right')) - 1
+        if i < 0:
+            raise IndexError(iterations)
+        return self[i]
+
+    # decompressed data of a frame, either the whole frame or its difference with the previous one
+    def decode(self, i: int):
+        entry = self.index[i]
+        compressed = self.data[entry['offset']:entry['offset'] + entry['length']]
+        return np.frombuffer(zlib.decompress(compressed), dtype=np.uint8).reshape((self.side, self.side))
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        # decode forward from the last keyframe at or before i
+        start = int(np.flatnonzero(self.index['keyframe'][:i + 1])[-1])
+        frame = self.decode(start)
+        for j in range(start + 1, i + 1):
+            frame = frame + self.decode(j)
+        return frame.view(np.int8)
+
+    def __iter__(self):
+        frame = None
+        for i in range(len(self)):
+            frame = self.decode(i) if self.index[i]['keyframe'] else frame + self.decode(i)
+            yield frame.view(np.int8)
+
+
+# generator that writes type_matrix to a history file after every iteration that moved nodes, as
+# the metrics records of iterations pass through. Frames are indexed by the number of completed
+# iterations, so the grid after any iteration is the last frame at or before it
+def stream_history(iterations, writer: HistoryWriter):
+    for record in iterations:
+        if record['moves'] > 0:
+            writer.append(params.type_matrix, record['iteration'] + 1)
+        yield record
+
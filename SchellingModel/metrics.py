@@ -0,0 +1,86 @@
+"""
+Segregation metrics computed every iteration, which can be streamed to a file instead of keeping
+every frame of the grid
+"""
+import csv
+import numpy as np
+import simulation_parameters as params
+
+
+FIELDS = ['iteration', 'same_type_fraction', 'unstable', 'moves', 'dissimilarity']
+
+
+# metrics of the grid at the start of an iteration, and of the movement during it
+# counts are the neighbour_type_counts of grid, so they are not computed twice
+def iteration_metrics(iteration: int, grid: np.ndarray, counts: np.ndarray, unstable: int, moves: int):
+    same, nodes = same_type_sum(grid, counts)
+    return metrics_record(iteration, same, nodes, unstable, moves, block_composition(grid))
+
+
+# metrics record from partial results, which may have been accumulated over parts of the grid
+def metrics_record(iteration: int, same: float, nodes: int, unstable: int, moves: int, composition: np.ndarray):
+    return {
+        'iteration': iteration,
+        'same_type_fraction': same / nodes if nodes != 0 else 0.,
+        'unstable': unstable,
+        'moves': moves,
+        'dissimilarity': dissimilarity_index(composition),
+    }
+
+
+# sum, over non empty cells with neighbours, of the fraction of neighbours of the same type, and the
+# number of such cells. Their ratio is the mean same type fraction
+def same_type_sum(grid: np.ndarray, counts: np.ndarray):
+    occupied = grid != -1
+    nneighbours = counts.sum(axis=0)
+    same = np.take_along_axis(counts, np.where(occupied, grid, 0)[None], axis=0)[0]
+    has_neighbours = occupied & (nneighbours > 0)
+    return float(np.sum(same[has_neighbours] / nneighbours[has_neighbours])), int(has_neighbours.sum())
+
+
+# number of cells of each type in every square block of params.dissimilarity_block cells, shape
+# (blocks, types). grid may be a part of the whole grid starting at (row, col), in which case its
+# counts are added to composition
+def block_composition(grid: np.ndarray, row: int = 0, col: int = 0, composition: np.ndarray = None):
+    block = params.dissimilarity_block
+    nblocks = -(-params.side // block)  # ceil division, the last blocks may be partial
+    rows, cols = np.nonzero(grid != -1)
+    types = grid[rows, cols]
+    block_index = ((row + rows) // block) * nblocks + (col + cols) // block
+    if composition is None:
+        composition = empty_composition()
+    indices, counts = np.unique(block_index * params.types + types, return_counts=True)
+    composition.reshape(-1)[indices] += counts
+    return composition
+
+
+# block_composition of a grid without any non empty cell
+def empty_composition():
+    nblocks = -(-params.side // params.dissimilarity_block)
+    return np.zeros((nblocks * nblocks, params.types), dtype=np.int64)
+
+
+# multigroup dissimilarity index of a block_composition
+# 0 when every block has the same type composition as the whole grid, 1 when no block mixes types
+def dissimilarity_index(composition: np.ndarray):
+    block_totals = composition.sum(axis=1)
+    total = block_totals.sum()
+    if total == 0:
+        return 0.
+    overall = composition.sum(axis=0) / total
+    interaction = np.sum(overall * (1 - overall))
+    if interaction == 0:
+        return 0.
+    populated = block_totals > 0
+    proportions = composition[populated] / block_totals[populated, None]
+    return float(np.sum(block_totals[populated, None] * np.abs(proportions - overall)) / (2 * total * interaction))
+
+
+# generator that writes every metrics record of iterations to a csv file as it passes through
+def stream_metrics(iterations, path: str):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in iterations:
+            writer.writerow(record)
+            yield record
@@ -1,12 +1,15 @@
 """
-Handles targeted movement. Unstable nodes are moved to the first node found where it is stable
+Handles targeted movement. Unstable nodes are moved to the first node found where it is stable, the
+nearest node where it is stable, or the node where it scores best
 """
 from abc import ABC, abstractmethod
+import heapq
 import random
 import numpy as np
 from type_hints import Node
 import simulation_parameters as params
 import utility
+import topology
 
 
 class MovementTactic(ABC):
@@ -16,6 +19,10 @@ class MovementTactic(ABC):
     Every movement tactic must handle how a node moves when it is unstable, hence it must implement
     the handle_empty_node method
     """
+    # whether the moves only depend on the grid, so that reaching the same grid again means the
+    # nodes move in a cycle. Tactics have to opt in
+    deterministic = False
+
     @abstractmethod
     def handle_empty_node(self, node: Node) -> int:
         """
@@ -28,6 +35,7 @@ class MovementTactic(ABC):
         """
         Moves node to empty
         """
+        utility.update_grid_hash(node, empty, params.type_matrix[node])
         params.type_matrix[empty] = params.type_matrix[node]
         params.type_matrix[node] = -1
         params.empty_nodes.add(node)
@@ -50,16 +58,23 @@ class RandomMovement(MovementTactic):
 
 
 class TargetedMovement(MovementTactic):
+    # moves only depend on the grid, for this tactic and the ones derived from it
+    deterministic = True
+
     def __init__(self):
         self.empty_map = utility.initialize_empty_map()
+        # fixed pseudo random rank of every node, by flat index. Unstable nodes move to the acceptable
+        # empty node of lowest rank, rather than the first one found in params.empty_nodes, whose order
+        # depends on the history of the set and not only on the grid. So the moves only depend on the grid
+        nodes = params.side * params.side
+        ranks = utility.zobrist_bitstrings(np.arange(nodes), np.zeros(nodes, dtype=int))
+        self.rank = dict(zip(utility.iter_positions(), ranks.tolist()))
 
     def handle_empty_node(self, node: Node):
-        target = None
-        for empty in params.empty_nodes:
-            # if the score of this (empty) node is good enough
-            if self.empty_map[empty][params.type_matrix[node]] >= params.neighbour_amount:
-                target = empty
-                break
+        node_type = params.type_matrix[node]
+        target = min((empty for empty in params.empty_nodes
+                      if self.empty_map[empty][node_type] >= params.neighbour_amount),
+                     key=self.rank.__getitem__, default=None)
         if target is not None:
             params.empty_nodes.remove(target)
         return target
@@ -67,18 +82,168 @@ class TargetedMovement(MovementTactic):
     # move a node to target (empty) node
     def move_node(self, node: Node, empty: Node):
         super().move_node(node, empty)  # super allows calling base class method
-        self.empty_map.pop(empty)
+        self.remove_empty(empty)
 
         # after moving, affected neighbour cells of moved cells have to be updated
         self.update_neighbours(node)
         self.update_neighbours(empty)
 
     def update_neighbours(self, node: Node):
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                # index of the neighbour
-                neighbour = tuple(np.add(node, (i, j)))
-                # if the node is a valid node, it isn't the central node, and is not empty
-                if utility.valid_node(neighbour) and params.type_matrix[neighbour] == -1:
-                    self.empty_map[neighbour] = {i: utility.neighbourhood_score(neighbour, i)
-                                                 for i in range(params.types)}
+        # the node itself and its neighbours, whose scores may have changed
+        for neighbour in [node] + topology.neighbour_nodes(node):
+            # only empty nodes are kept in empty_map
+            if params.type_matrix[neighbour] == -1:
+                self.set_scores(neighbour, {i: utility.neighbourhood_score(neighbour, i)
+                                            for i in range(params.types)})
+
+    # record the scores of an empty node. Subclasses that index empty_map extend this
+    def set_scores(self, node: Node, scores: dict):
+        self.empty_map[node] = scores
+
+    # forget an empty node that has been filled. Subclasses that index empty_map extend this
+    def remove_empty(self, node: Node):
+        self.empty_map.pop(node, None)
+
+
+class NearestMovement(TargetedMovement):
+    """
+    Moves unstable node to the nearest empty node where it is stable
+
+    For every type, the empty nodes where that type is stable are kept in square buckets of
+    params.bucket_size nodes, which are searched in rings around the unstable node. On a torus, rings
+    and distances wrap around the edges of the grid
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = [{} for _ in range(params.types)]  # bucket -> set of acceptable nodes
+        self.sizes = [0] * params.types    # number of acceptable nodes of every type
+        for node, scores in self.empty_map.items():
+            self.index(node, scores)
+
+    def bucket(self, node: Node):
+        return node[0] // params.bucket_size, node[1] // params.bucket_size
+
+    # add node to the buckets of the types it is acceptable for, and remove it from the others
+    def index(self, node: Node, scores: dict):
+        bucket = self.bucket(node)
+        for t in range(params.types):
+            nodes = self.buckets[t].setdefault(bucket, set())
+            if scores[t] >= params.neighbour_amount:
+                if node not in nodes:
+                    nodes.add(node)
+                    self.sizes[t] += 1
+            elif node in nodes:
+                nodes.remove(node)
+                self.sizes[t] -= 1
+
+    # remove node from the buckets of every type
+    def unindex(self, node: Node):
+        bucket = self.bucket(node)
+        for t in range(params.types):
+            nodes = self.buckets[t].get(bucket)
+            if nodes is not None and node in nodes:
+                nodes.remove(node)
+                self.sizes[t] -= 1
+
+    # buckets at Chebyshev distance ring from a bucket. On a torus they wrap around, and a bucket
+    # may be yielded more than once by rings that reach around the whole grid
+    def ring(self, centre: Node, ring: int):
+        buckets = -(-params.side // params.bucket_size)
+        for i in range(centre[0] - ring, centre[0] + ring + 1):
+            if not params.torus and (i < 0 or i >= buckets):
+                continue
+            step = 1 if abs(i - centre[0]) == ring else 2 * ring
+            for j in range(centre[1] - ring, centre[1] + ring + 1, max(step, 1)):
+                if params.torus:
+                    yield i % buckets, j % buckets
+                elif 0 <= j < buckets:
+                    yield i, j
+
+    # squared distance between two nodes, wrapped around the edges on a torus
+    def distance(self, node: Node, other: Node):
+        di, dj = abs(node[0] - other[0]), abs(node[1] - other[1])
+        if params.torus:
+            di, dj = min(di, params.side - di), min(dj, params.side - dj)
+        return di * di + dj * dj
+
+    def handle_empty_node(self, node: Node):
+        node_type = params.type_matrix[node]
+        if self.sizes[node_type] == 0:
+            return None
+        centre = self.bucket(node)
+        buckets = -(-params.side // params.bucket_size)
+        # going around a torus can cross the last bucket, which may be partial
+        partial = 1 if params.torus and params.side % params.bucket_size else 0
+        target, target_distance = None, float('inf')
+        seen = set()
+        for ring in range((buckets // 2 if params.torus else buckets) + 1):
+            # nodes in buckets of this ring are at least this (squared) distance away
+            if max(ring - 1 - partial, 0) ** 2 * params.bucket_size ** 2 >= target_distance:
+                break
+            for bucket in self.ring(centre, ring):
+                if bucket in seen:
+                    continue
+                seen.add(bucket)
+                for candidate in self.buckets[node_type].get(bucket, ()):
+                    distance = self.distance(node, candidate)
+                    # ties go to the lowest rank, not to the first node found in the bucket set
+                    if distance < target_distance or \
+                            (distance == target_distance and self.rank[candidate] < self.rank[target]):
+                        target, target_distance = candidate, distance
+        if target is not None:
+            # the target is taken, even though it only gets filled once the moves are applied
+            self.unindex(target)
+            params.empty_nodes.remove(target)
+        return target
+
+    def set_scores(self, node: Node, scores: dict):
+        super().set_scores(node, scores)
+        self.index(node, scores)
+
+    def remove_empty(self, node: Node):
+        super().remove_empty(node)
+        self.unindex(node)
+
+
+class BestScoreMovement(TargetedMovement):
+    """
+    Moves unstable node to the empty node with the highest score for its type, if it is stable there
+
+    For every type, empty nodes are kept in a heap ordered by score. Entries whose score is out of
+    date are skipped when they reach the top, and the heaps are rebuilt once they pile up
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rebuild()
+
+    def rebuild(self):
+        self.heaps = [[(-scores[t], node) for node, scores in self.empty_map.items()
+                       if node in params.empty_nodes] for t in range(params.types)]
+        for heap in self.heaps:
+            heapq.heapify(heap)
+
+    def handle_empty_node(self, node: Node):
+        heap = self.heaps[params.type_matrix[node]]
+        while heap:
+            score, target = heap[0]
+            scores = self.empty_map.get(target)
+            # skip entries of nodes that were filled or taken, or whose score changed since
+            if target not in params.empty_nodes or scores is None or \
+                    scores[params.type_matrix[node]] != -score:
+                heapq.heappop(heap)
+                continue
+            if -score < params.neighbour_amount:
+                return None
+            heapq.heappop(heap)
+            params.empty_nodes.remove(target)
+            return target
+        return None
+
+    def set_scores(self, node: Node, scores: dict):
+        super().set_scores(node, scores)
+        for t in range(params.types):
+            heapq.heappush(self.heaps[t], (-scores[t], node))
+        if len(self.heaps[0]) > 4 * len(self.empty_map) + 64:
+            self.rebuild()
@@ -0,0 +1,82 @@
+"""
+Runs the scoring phase of every iteration in several worker processes
+
+The grid is held in shared memory (or in the memory mapped file, if memmap_file is set), and every
+worker scores row bands of it, which have a halo like tiles. Moves are then reconciled
+and applied by the main process with the same deterministic assignment as tiles.run
+"""
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import simulation_parameters as params
+import tiles
+
+
+# parameters the workers need, sent to them since they may not share the state of this process
+WORKER_PARAMETERS = ('side', 'types', 'gets_along_with', 'neighbour_amount', 'dissimilarity_block', 'memmap_file',
+                     'neighbourhood', 'neighbourhood_radius')
+
+shared_grid = None  # shared memory block holding type_matrix, when it isn't memory mapped
+
+
+# create type_matrix in shared memory, and initialize it
+def initialize_grid():
+    global shared_grid
+    shared_grid = shared_memory.SharedMemory(create=True, size=params.side * params.side)
+    params.type_matrix = np.ndarray((params.side, params.side), dtype=np.int8, buffer=shared_grid.buf)
+    tiles.randomize_grid()
+
+
+# copy type_matrix out of shared memory and release it
+def release_grid():
+    global shared_grid
+    if shared_grid is not None:
+        params.type_matrix = params.type_matrix.copy()
+        shared_grid.close()
+        shared_grid.unlink()
+        shared_grid = None
+
+
+# runs in every worker when it starts, attaching it to the grid
+def initialize_worker(parameters: dict, grid_name: str):
+    global shared_grid
+    for name, value in parameters.items():
+        setattr(params, name, value)
+    shape = (params.side, params.side)
+    if params.memmap_file is not None:
+        params.type_matrix = np.memmap(params.memmap_file, dtype=np.int8, mode='r', shape=shape)
+    else:
+        shared_grid = shared_memory.SharedMemory(name=grid_name)
+        params.type_matrix = np.ndarray(shape, dtype=np.int8, buffer=shared_grid.buf)
+
+
+# score the rows [top, bottom) in a worker. Returns the results of tiles.score_tile, with the block
+# composition of the block rows the band covers instead of the whole grid
+def score_band(bounds: tuple):
+    top, bottom = bounds
+    block = params.dissimilarity_block
+    nblocks = -(-params.side // block)
+    first, last = top // block, -(-bottom // block)
+    composition = np.zeros(((last - first) * nblocks, params.types), dtype=np.int64)
+    return tiles.score_tile(top, bottom, 0, params.side, composition, first * block), first * nblocks, composition
+
+
+# generator that runs the model with the scoring phase split across params.workers processes,
+# yielding the metrics of every iteration
+def run():
+    # several bands per worker, so that they stay busy when bands take different times
+    band_height = max(1, -(-params.side // (4 * params.workers)))
+    bands = [(top, min(top + band_height, params.side)) for top in range(0, params.side, band_height)]
+    parameters = {name: getattr(params, name) for name in WORKER_PARAMETERS}
+    grid_name = shared_grid.name if shared_grid is not None else None
+
+    with Pool(params.workers, initializer=initialize_worker, initargs=(parameters, grid_name)) as pool:
+        def score_bands(composition: np.ndarray):
+            # imap keeps the bands in order, so the results are in row major order
+            for result, offset, band_composition in pool.imap(score_band, bands):
+                composition[offset:offset + len(band_composition)] += band_composition
+                yield result
+
+        try:
+            yield from tiles.run(score_bands)
+        finally:
+            release_grid()
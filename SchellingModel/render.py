@@ -0,0 +1,148 @@
+"""
+Headless rendering of run history to PNG sequences or video, without matplotlib
+
+Frames are coloured through a palette lookup table and upscaled by repeating every node scale
+times in both directions. Frames are rendered in a thread pool (numpy and zlib release the GIL), and
+written in order, either as numbered PNG files or as raw RGB piped to a command such as ffmpeg
+
+Run as `python render.py history_file output [scale] [config]`, where history_file is written
+by history.py and output is a directory for PNG files, or a video file written by ffmpeg
+"""
+import os
+import struct
+import subprocess
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import simulation_parameters as params
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.avi', '.gif')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+# uint8 RGB colour of every value of the grid, offset by one: row 0 is empty nodes, row t + 1 is type t
+def palette():
+    colours = np.array([params.empty_colour] + list(params.type_colours), dtype=float)
+    return np.round(np.clip(colours, 0., 1.) * 255).astype(np.uint8)
+
+
+# RGB image of a frame, every node is a scale x scale square
+def render_frame(frame: np.ndarray, lut: np.ndarray, scale: int = 1):
+    # take is several times faster than fancy indexing for a small table
+    image = lut.take(np.asarray(frame) + 1, axis=0)
+    if scale > 1:
+        # repeat rows and columns in a single copy
+        height, width = image.shape[:2]
+        image = np.broadcast_to(image[:, None, :, None, :], (height, scale, width, scale, 3)) \
+            .reshape(height * scale, width * scale, 3)
+    return image
+
+
+def png_chunk(kind: bytes, data: bytes):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+# encode an RGB image as PNG, without filtering since the images are large flat areas
+def encode_png(image: np.ndarray, level: int = 6):
+    height, width = image.shape[:2]
+    # every row starts with its filter type, 0 for none
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 3)
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return PNG_SIGNATURE + png_chunk(b'IHDR', header) + \
+        png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) + png_chunk(b'IEND', b'')
+
+
+# map function over items in the executor, yielding results in order and keeping at most limit of
+# them in flight, so frames are never all held in memory at once
+def ordered_map(executor: ThreadPoolExecutor, function, items, limit: int):
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# write frames as directory/frame_000000.png and so on, returns the number of frames written
+def export_png(frames, directory: str, scale: int = 1, workers: int = None):
+    os.makedirs(directory, exist_ok=True)
+    lut = palette()
+
+    def write(item):
+        i, frame = item
+        with open(os.path.join(directory, f'frame_{i:06d}.png'), 'wb') as f:
+            f.write(encode_png(render_frame(frame, lut, scale), level=1))
+
+    workers = workers or os.cpu_count()
+    count = 0
+    with ThreadPoolExecutor(workers) as executor:
+        for _ in ordered_map(executor, write, enumerate(frames), 4 * workers):
+            count += 1
+    return count
+
+
+# ffmpeg command that encodes raw RGB frames of a width x height image from its standard input
+def ffmpeg_command(path: str, width: int, height: int, fps: int = 30):
+    return ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+            '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', path]
+
+
+# pipe frames as raw RGB (row major, 3 bytes per pixel) to the standard input of command, returns
+# the number of frames written. Raises CalledProcessError if command fails, or BrokenPipeError if it
+# exits before reading every frame, once it has exited
+def export_stream(frames, command: list, scale: int = 1, workers: int = None):
+    lut = palette()
+    workers = workers or os.cpu_count()
+    count = 0
+
+    def render(frame):
+        return render_frame(frame, lut, scale).tobytes()
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    broken = False
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            for data in ordered_map(executor, render, frames, 4 * workers):
+                process.stdin.write(data)
+                count += 1
+    except BrokenPipeError:
+        # the command exited before reading every frame, its exit code is checked below
+        broken = True
+    finally:
+        # the command may have exited early, in which case closing the pipe fails, but it is still waited for
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+    # checked after the cleanup, so that an error while rendering isn't replaced by this one
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    if broken:
+        raise BrokenPipeError(f'{command[0]} exited before reading every frame')
+    return count
+
+
+if __name__ == '__main__':
+    import config
+    import history
+
+    if len(sys.argv) > 4:
+        config.apply_config(config.load_config(sys.argv[4]))
+    reader = history.HistoryReader(sys.argv[1])
+    output = sys.argv[2]
+    scale = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    assert reader.side > 0 and scale >= 1
+    if output.endswith(VIDEO_EXTENSIONS):
+        # yuv420p needs even dimensions
+        size = reader.side * scale
+        assert size % 2 == 0, 'side * scale should be even for video'
+        written = export_stream(reader, ffmpeg_command(output, size, size), scale)
+    else:
+        written = export_png(reader, output, scale)
+    print(f'{written} frames written to {output}')
@@ -1,45 +1,111 @@
 """
 Implementation of Schelling model
+
+Run as `python schelling_model.py [config.toml | config.json]`, where the optional configuration
+file overrides values in simulation_parameters.py (see config.py)
 """
+import sys
 import simulation_parameters as params
 import utility
+import metrics
+import tiles
+import parallel
+import topology
+import config
+import history
 
 
-# value checks
-utility.check_values_sanity()
-# initialize the graph. -1 is empty
-utility.initialize_grid_graph()
-
-params.empty_nodes = {node for node in utility.iter_positions() if params.type_matrix[node] == -1}
-params.tactic = params.tactic()
+# generator that runs the model, yielding the metrics of every iteration
+# sets params.status to the reason it stopped
+def run():
+    params.status = 'max_iterations'
+    occupied = int((params.type_matrix != -1).sum())
+    # hashes of every grid seen so far, to detect nodes moving in cycles
+    seen_hashes = {params.grid_hash}
+    for iteration in range(params.max_iterations):
+        counts = utility.neighbour_type_counts(params.type_matrix)
+        scores = utility.neighbourhood_scores(counts)
+        # nodes whose score is too low (they're unstable)
+        unstable = utility.unstable_nodes(params.type_matrix, scores)
+        if len(unstable) < params.unstable_tolerance * occupied:
+            params.status = 'tolerance'
+            yield metrics.iteration_metrics(iteration, params.type_matrix, counts, len(unstable), 0)
+            break
 
-params.grid_history.append(params.type_matrix.copy())
-for _ in range(params.max_iterations):
-    corrected_nodes = 0
-    nodes_to_move = []  # elements should be tuples of the form (from: Node, to: Node)
-    for node in utility.iter_positions():
-        # empty nodes aren't shuffled around
-        if params.type_matrix[node] == -1:
-            continue
-
-        # if the score of this node is too low (it's unstable) and there actually are nodes we can
-        # move to
-        if utility.neighbourhood_score(node, params.type_matrix[node]) < \
-                params.neighbour_amount and len(params.empty_nodes) > 0:
+        corrected_nodes = 0
+        nodes_to_move = []  # elements should be tuples of the form (from: Node, to: Node)
+        for node in unstable:
+            # if there aren't any nodes we can move to
+            if len(params.empty_nodes) == 0:
+                break
             target = params.tactic.handle_empty_node(node)
             if target is not None:
                 nodes_to_move.append((node, target))
                 corrected_nodes += 1
+        record = metrics.iteration_metrics(iteration, params.type_matrix, counts, len(unstable),
+                                           corrected_nodes)
+
+        # actually carry out the movement
+        for movement in nodes_to_move:
+            params.tactic.move_node(movement[0], movement[1])
+
+        if params.store_history:
+            params.grid_history.append(params.type_matrix.copy())
+        yield record
+        if corrected_nodes == 0:
+            params.status = 'converged'
+            if params.store_history:
+                params.grid_history.pop()
+            break
+        # the same grid was reached before, so nodes will keep moving in a cycle. Only for deterministic
+        # tactics, under which the moves from a grid are always the same (they only depend on the grid,
+        # not on the order of params.empty_nodes)
+        if params.tactic.deterministic and params.grid_hash in seen_hashes:
+            params.status = 'cycle'
+            break
+        seen_hashes.add(params.grid_hash)
+
+
+# worker processes import this module, and must not run the simulation
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        config.apply_config(config.load_config(sys.argv[1]))
+    # value checks
+    utility.check_values_sanity()
+    if params.memmap_file is not None or params.workers > 1:
+        # the grid is too large for memory or split across processes, so it is run in parts
+        params.store_history = False
+        if params.memmap_file is not None:
+            tiles.initialize_grid()
+        else:
+            parallel.initialize_grid()
+        iterations = parallel.run() if params.workers > 1 else tiles.run()
+    else:
+        topology.build_neighbour_table()
+        # initialize the graph. -1 is empty
+        utility.initialize_grid_graph()
+        utility.initialize_zobrist()
 
-    # actually carry out the movement
-    for movement in nodes_to_move:
-        params.tactic.move_node(movement[0], movement[1])
+        params.empty_nodes = utility.empty_node_set()
+        params.tactic = params.tactic()
 
-    params.grid_history.append(params.type_matrix.copy())
-    if corrected_nodes == 0:
-        grid_history = params.grid_history.pop()
-        break
+        if params.store_history:
+            params.grid_history.append(params.type_matrix.copy())
+        iterations = run()
 
+    writer = None
+    if params.history_file is not None:
+        writer = history.HistoryWriter(params.history_file, params.side)
+        writer.append(params.type_matrix, 0)  # the initial grid, before any iteration
+        iterations = history.stream_history(iterations, writer)
+    if params.metrics_file is not None:
+        iterations = metrics.stream_metrics(iterations, params.metrics_file)
+    # the reason the run stopped is left in params.status
+    for record in iterations:
+        pass
+    if writer is not None:
+        writer.close()
 
-# plotting
-utility.show_grid()
+    # plotting
+    if params.store_history:
+        utility.show_grid()
@@ -17,11 +17,41 @@ gets_along_with = np.matrix([
 ])
 type_matrix = np.zeros((side, side), dtype=int)  # type of (i, j) node
 empty_colour = (0.3, 0.3, 0.3)    # colour of empty cells
+# neighbourhood of a node: 'moore' (square), 'von_neumann' (diamond) or 'graph' (read from graph_file)
+neighbourhood = 'moore'
+neighbourhood_radius = 1    # radius of lattice neighbourhoods
+torus = False   # whether lattice neighbourhoods wrap around the edges of the grid
+graph_file = None   # edge list for the 'graph' neighbourhood, one "row col row col" edge per line
 max_iterations = 500  # maximum iterations the simulation will run for
 neighbour_amount = 0.75  # what threshold of neighbourhood_score is stable?
 # what movement tactic is used. For implementation reasons, this must be a type and not an object
+# one of RandomMovement, TargetedMovement, NearestMovement or BestScoreMovement
+# runs stop on a cycle (a grid reached again) with every tactic except RandomMovement
 tactic = tactics.TargetedMovement
+bucket_size = 8     # side of the buckets NearestMovement indexes empty nodes in
 types = len(types_distribution)
 
+# stop once the fraction of unstable nodes among non empty nodes drops below this, 0 to only stop
+# when no node can move
+unstable_tolerance = 0.
+# when set, type_matrix is stored in this file instead of memory and processed in tiles, for grids
+# that don't fit in memory. History and the plot aren't available in this mode
+memmap_file = None
+tile_size = 1024    # side of the tiles a memory mapped grid is processed in
+# number of processes the grid is scored in. Above 1, the grid is held in shared memory (unless it is
+# memory mapped) and has the same limitations as a memory mapped grid
+workers = 1
+store_history = True    # keep every iteration in grid_history, to be shown by the plot
+metrics_file = None     # csv file the metrics of every iteration are streamed to, None to skip
+history_file = None     # file every iteration is written to in the format of history.py, None to skip
+dissimilarity_block = 5  # side of the blocks the dissimilarity index compares
+
 grid_history = []
 empty_nodes = set()
+# neighbour table in CSR form, built by topology.build_neighbour_table
+neighbour_indptr = None
+neighbour_indices = None
+neighbour_sources = None
+zobrist_seed = 0
+grid_hash = 0
+status = None   # why the simulation stopped: 'converged', 'cycle', 'tolerance' or 'max_iterations'
@@ -0,0 +1,211 @@
+"""
+Runs the model on a grid stored in a memory mapped file, for grids too large to fit in memory
+
+The grid is processed in square tiles, each read with a halo of neighbourhood_radius cells so that
+scores near tile edges see their neighbours in other tiles. Unstable nodes and empty nodes of every tile are
+collected as flat indices, and movement is reconciled across tiles once all of them have been
+scored. The starting grid is drawn row by row, so the result doesn't depend on the tiling
+"""
+import numpy as np
+import simulation_parameters as params
+import movement_tactics as tactics
+import utility
+import metrics
+
+# number of random numbers drawn at once by randomize_grid
+RANDOM_BAND_CELLS = 1 << 20
+
+
+# create the memory mapped grid and initialize it tile by tile
+def initialize_grid():
+    params.type_matrix = np.memmap(params.memmap_file, dtype=np.int8, mode='w+', shape=(params.side, params.side))
+    randomize_grid()
+    params.type_matrix.flush()
+
+
+# fill type_matrix in bands of full rows. Every node is independently empty with probability
+# empty_fraction, or otherwise of a type drawn from types_distribution, so the counts are only
+# expected to match the fractions. The random numbers are drawn in row major order whatever the
+# band height, so the grid only depends on the seed, not on tile_size
+def randomize_grid():
+    # -1 for empty, otherwise the type whose cumulative probability range the random number is in
+    thresholds = np.cumsum([params.empty_fraction] +
+                           [(1 - params.empty_fraction) * fraction for fraction in params.types_distribution])
+    band_height = max(1, RANDOM_BAND_CELLS // params.side)
+    for top in range(0, params.side, band_height):
+        bottom = min(top + band_height, params.side)
+        draws = np.random.random_sample((bottom - top, params.side))
+        band = np.searchsorted(thresholds, draws, side='right') - 1
+        # guards against rounding in the last threshold
+        params.type_matrix[top:bottom] = np.minimum(band, params.types - 1)
+
+
+# bounds (top, bottom, left, right) of every tile, in row major order
+def iter_tiles():
+    for top in range(0, params.side, params.tile_size):
+        for left in range(0, params.side, params.tile_size):
+            yield top, min(top + params.tile_size, params.side), left, min(left + params.tile_size, params.side)
+
+
+# a tile of the grid with a halo of neighbourhood_radius cells on every side. The halo is empty
+# outside the grid
+def halo_window(top: int, bottom: int, left: int, right: int):
+    halo = params.neighbourhood_radius
+    window = np.full((bottom - top + 2 * halo, right - left + 2 * halo), -1, dtype=np.int8)
+    inner_top, inner_bottom = max(top - halo, 0), min(bottom + halo, params.side)
+    inner_left, inner_right = max(left - halo, 0), min(right + halo, params.side)
+    window[inner_top - top + halo:inner_bottom - top + halo, inner_left - left + halo:inner_right - left + halo] = \
+        params.type_matrix[inner_top:inner_bottom, inner_left:inner_right]
+    return window
+
+
+# flat index in the whole grid of every cell of the halo_window of a tile, -1 outside the grid. Only
+# the window is indexed, in the smallest signed dtype that holds every flat index of the grid
+def window_indices(top: int, bottom: int, left: int, right: int):
+    halo = params.neighbourhood_radius
+    dtype = np.min_scalar_type(-params.side * params.side)
+    rows = np.arange(top - halo, bottom + halo, dtype=dtype)[:, None]
+    cols = np.arange(left - halo, right + halo, dtype=dtype)[None, :]
+    inside = (rows >= 0) & (rows < params.side) & (cols >= 0) & (cols < params.side)
+    return np.where(inside, rows * dtype.type(params.side) + cols, dtype.type(-1))
+
+
+# moves for RandomMovement: every unstable node, in order, moves to a random empty node
+def assign_random(unstable: np.ndarray, unstable_types: np.ndarray, empties: np.ndarray, acceptable: list):
+    count = min(len(unstable), len(empties))
+    return unstable[:count], empties[np.random.permutation(len(empties))[:count]]
+
+
+# moves for TargetedMovement: every unstable node, in order, moves to the first empty node (in flat
+# order) whose score for its type is good enough, that isn't already taken
+def assign_targeted(unstable: np.ndarray, unstable_types: np.ndarray, empties: np.ndarray, acceptable: list):
+    sources, targets = [], []
+    taken = np.zeros(0, dtype=unstable.dtype)
+    for t in range(params.types):
+        movers = unstable[unstable_types == t]
+        free = acceptable[t][~np.isin(acceptable[t], taken)]
+        count = min(len(movers), len(free))
+        sources.append(movers[:count])
+        targets.append(free[:count])
+        taken = np.concatenate((taken, free[:count]))
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+# how moves are assigned for every supported movement tactic
+ASSIGN_MOVES = {
+    tactics.RandomMovement: assign_random,
+    tactics.TargetedMovement: assign_targeted,
+}
+
+
+# score one tile. Returns the flat indices of its unstable nodes, their types, the flat indices of
+# its empty nodes, and for every type the flat indices of empty nodes whose score is good enough
+# also returns the same_type_sum of the tile, and adds its block_composition to composition, which
+# holds the blocks from row composition_top of the grid onwards
+def score_tile(top: int, bottom: int, left: int, right: int, composition: np.ndarray, composition_top: int = 0):
+    halo = params.neighbourhood_radius
+    window = halo_window(top, bottom, left, right)
+    tile = window[halo:-halo, halo:-halo]
+    counts = utility.window_neighbour_type_counts(window)
+    scores = utility.neighbourhood_scores(counts)
+
+    # flat index of every node of the tile in the whole grid
+    flat = window_indices(top, bottom, left, right)[halo:-halo, halo:-halo]
+    unstable = utility.unstable_mask(tile, scores)
+    empty = tile == -1
+    acceptable = [flat[empty & (scores[t] >= params.neighbour_amount)] for t in range(params.types)]
+
+    metrics.block_composition(tile, top - composition_top, left, composition)
+    return flat[unstable], tile[unstable], flat[empty], acceptable, metrics.same_type_sum(tile, counts)
+
+
+# score every tile of the grid in this process, yielding the results of score_tile
+def score_tiles(composition: np.ndarray):
+    for top, bottom, left, right in iter_tiles():
+        yield score_tile(top, bottom, left, right, composition)
+
+
+# hash of the grid, computed tile by tile so that a memory mapped grid isn't read at once
+def tiled_grid_hash():
+    grid_hash = 0
+    for top, bottom, left, right in iter_tiles():
+        flat = window_indices(top, bottom, left, right)[params.neighbourhood_radius:-params.neighbourhood_radius,
+                                                         params.neighbourhood_radius:-params.neighbourhood_radius]
+        bitstrings = utility.zobrist_bitstrings(flat.reshape(-1), params.type_matrix[top:bottom, left:right].reshape(-1))
+        grid_hash ^= int(np.bitwise_xor.reduce(bitstrings))
+    return grid_hash
+
+
+# change of the grid hash when the nodes of the given types move from sources to targets
+def moves_hash(sources: np.ndarray, targets: np.ndarray, moved_types: np.ndarray):
+    empty = np.full(len(sources), -1)
+    bitstrings = utility.zobrist_bitstrings(np.concatenate((sources, sources, targets, targets)),
+                                            np.concatenate((moved_types, empty, empty, moved_types)))
+    return int(np.bitwise_xor.reduce(bitstrings)) if len(bitstrings) else 0
+
+
+# generator that runs the model tile by tile, yielding the metrics of every iteration
+# score_grid is called with the composition to fill every iteration, and returns the score_tile
+# results of parts of the grid in row major order
+# sets params.status to the reason it stopped
+def run(score_grid=score_tiles):
+    assert params.tactic in ASSIGN_MOVES    # tactic must be supported on tiled grids
+    params.status = 'max_iterations'
+    assign_moves = ASSIGN_MOVES[params.tactic]
+    grid = params.type_matrix.reshape(-1)    # flat view of the grid
+    occupied = sum(int((params.type_matrix[top:bottom, left:right] != -1).sum())
+                   for top, bottom, left, right in iter_tiles())
+    # hashes of every grid seen so far, to detect nodes moving in cycles under deterministic tactics
+    seen_hashes = set()
+    if params.tactic.deterministic:
+        params.zobrist_seed = int(np.random.randint(np.iinfo(np.uint64).max, dtype=np.uint64))
+        params.grid_hash = tiled_grid_hash()
+        seen_hashes.add(params.grid_hash)
+    for iteration in range(params.max_iterations):
+        unstable, unstable_types, empties, acceptable = [], [], [], [[] for _ in range(params.types)]
+        same, nodes = 0., 0
+        composition = metrics.empty_composition()
+        for part_unstable, part_types, part_empties, part_acceptable, (part_same, part_nodes) in \
+                score_grid(composition):
+            unstable.append(part_unstable)
+            unstable_types.append(part_types)
+            empties.append(part_empties)
+            for t in range(params.types):
+                acceptable[t].append(part_acceptable[t])
+            same += part_same
+            nodes += part_nodes
+
+        # tiles are in row major order, but the nodes of different tiles interleave in flat order
+        unstable = np.concatenate(unstable)
+        order = np.argsort(unstable, kind='stable')
+        unstable, unstable_types = unstable[order], np.concatenate(unstable_types)[order]
+        empties = np.sort(np.concatenate(empties))
+        acceptable = [np.sort(np.concatenate(indices)) for indices in acceptable]
+
+        if len(unstable) < params.unstable_tolerance * occupied:
+            params.status = 'tolerance'
+            yield metrics.metrics_record(iteration, same, nodes, len(unstable), 0, composition)
+            break
+
+        sources, targets = assign_moves(unstable, unstable_types, empties, acceptable)
+        # actually carry out the movement, in flat order for locality in memory
+        order = np.argsort(targets)
+        sources, targets = sources[order], targets[order]
+        if params.tactic.deterministic:
+            params.grid_hash ^= moves_hash(sources, targets, grid[sources])
+        grid[targets] = grid[sources]
+        grid[np.sort(sources)] = -1
+        if isinstance(params.type_matrix, np.memmap):
+            params.type_matrix.flush()
+
+        yield metrics.metrics_record(iteration, same, nodes, len(unstable), len(sources), composition)
+        if len(sources) == 0:
+            params.status = 'converged'
+            break
+        # the same grid was reached before, and the moves only depend on the grid, so nodes will keep
+        # moving in a cycle
+        if params.tactic.deterministic:
+            if params.grid_hash in seen_hashes:
+                params.status = 'cycle'
+                break
+            seen_hashes.add(params.grid_hash)
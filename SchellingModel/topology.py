@@ -0,0 +1,86 @@
+"""
+Neighbourhood topologies. Every topology is turned into a neighbour table in CSR form: the
+neighbours of the node with flat index k are neighbour_indices[neighbour_indptr[k]:neighbour_indptr[k + 1]]
+"""
+import numpy as np
+import simulation_parameters as params
+from type_hints import Node
+
+
+TOPOLOGIES = ('moore', 'von_neumann', 'graph')
+
+
+# offsets (di, dj) of the neighbours of a node on a lattice topology
+def lattice_offsets():
+    radius = params.neighbourhood_radius
+    offsets = [(i, j) for i in range(-radius, radius + 1) for j in range(-radius, radius + 1)
+               if (i, j) != (0, 0) and (params.neighbourhood == 'moore' or abs(i) + abs(j) <= radius)]
+    if params.torus:
+        # on a small torus, offsets can wrap around to the node itself or to the same neighbour
+        seen = {(0, 0)}
+        unique = []
+        for i, j in offsets:
+            if (i % params.side, j % params.side) not in seen:
+                seen.add((i % params.side, j % params.side))
+                unique.append((i, j))
+        offsets = unique
+    return offsets
+
+
+# neighbour table of a lattice topology, built one column of offsets at a time
+# returns (neighbour_sources, neighbour_indices) in order of their node
+def lattice_table(dtype: type):
+    offsets = lattice_offsets()
+    nodes = params.side * params.side
+    rows, cols = np.divmod(np.arange(nodes, dtype=dtype), dtype(params.side))
+    # [k, o] is the flat index of the neighbour of node k at offset o, or -1 if it is off the grid
+    table = np.empty((nodes, len(offsets)), dtype=dtype)
+    for o, (i, j) in enumerate(offsets):
+        neighbour_rows, neighbour_cols = rows + i, cols + j
+        if params.torus:
+            table[:, o] = (neighbour_rows % params.side) * params.side + neighbour_cols % params.side
+        else:
+            valid = (neighbour_rows >= 0) & (neighbour_rows < params.side) & \
+                    (neighbour_cols >= 0) & (neighbour_cols < params.side)
+            table[:, o] = np.where(valid, neighbour_rows * params.side + neighbour_cols, -1)
+    valid = table != -1
+    sources = np.repeat(np.arange(nodes, dtype=dtype), valid.sum(axis=1))
+    return sources, table[valid]
+
+
+# neighbour table of the graph in params.graph_file, returns (neighbour_sources, neighbour_indices)
+# in order of their node. Every line of the file is an undirected edge between two nodes, written as
+# "row col row col"
+def graph_table(dtype: type):
+    nodes = params.side * params.side
+    edges = np.loadtxt(params.graph_file, dtype=np.int64, ndmin=2)
+    assert edges.shape[1] == 4 and np.all((edges >= 0) & (edges < params.side))
+    a = edges[:, 0] * params.side + edges[:, 1]
+    b = edges[:, 2] * params.side + edges[:, 3]
+    sources, targets = np.concatenate((a, b)), np.concatenate((b, a))
+    # a node is never its own neighbour, and repeated edges count once
+    pairs = np.unique(sources[sources != targets] * nodes + targets[sources != targets])
+    sources, targets = np.divmod(pairs, nodes)
+    return sources.astype(dtype), targets.astype(dtype)
+
+
+# build the neighbour table of params.neighbourhood, stored in params.neighbour_indptr,
+# params.neighbour_indices and params.neighbour_sources (the node each entry of neighbour_indices
+# is a neighbour of)
+def build_neighbour_table():
+    nodes = params.side * params.side
+    dtype = np.int32 if nodes < 2 ** 31 else np.int64
+    table = graph_table if params.neighbourhood == 'graph' else lattice_table
+    params.neighbour_sources, params.neighbour_indices = table(dtype)
+    params.neighbour_indptr = np.concatenate(([0], np.cumsum(np.bincount(params.neighbour_sources, minlength=nodes))))
+
+
+# flat indices of the neighbours of a node
+def neighbours(node: Node):
+    k = node[0] * params.side + node[1]
+    return params.neighbour_indices[params.neighbour_indptr[k]:params.neighbour_indptr[k + 1]]
+
+
+# nodes that are neighbours of a node
+def neighbour_nodes(node: Node):
+    return [tuple(neighbour) for neighbour in np.column_stack(np.divmod(neighbours(node), params.side)).tolist()]
@@ -1,9 +1,9 @@
-import random
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.widgets import Slider
 from type_hints import Node
 import simulation_parameters as params
+import topology
 
 
 # generator function to iterate through all positions on the grid
@@ -15,70 +15,146 @@ def iter_positions():
 
 # just checking if the inputted values are valid
 def check_values_sanity():
-    assert params.empty_fraction < 1.  # fraction of empty cells should be < 1
-    assert params.gets_along_with.shape[0] == params.gets_along_with.shape[1]  # square matrix
+    assert 0. <= params.empty_fraction < 1.  # fraction of empty cells should be < 1
+    gets_along_with = np.asarray(params.gets_along_with)
+    assert gets_along_with.ndim == 2 and gets_along_with.shape[0] == gets_along_with.shape[1]  # square matrix
     assert len(params.types_distribution) == len(params.type_colours) \
-        == params.gets_along_with.shape[0]  # consistency check
+        == gets_along_with.shape[0] == params.types  # consistency check
     # all values should be in [-1, 1]
-    assert all(abs(x) <= 1 for x in np.nditer(params.gets_along_with))
-    assert sum(params.types_distribution) == 1.    # sum of fractions is 1
-
-
-# check if a grid index is valid
-def valid_node(node: Node):
-    return node[0] >= 0 and node[0] < params.side and node[1] >= 0 and node[1] < params.side
+    assert np.all(np.abs(gets_along_with) <= 1)
+    # fractions are non negative and sum to 1, up to rounding in computed distributions
+    assert np.all(np.asarray(params.types_distribution) >= 0)
+    assert np.isclose(np.sum(params.types_distribution), 1.)
+    assert params.neighbourhood in topology.TOPOLOGIES
+    assert 1 <= params.neighbourhood_radius < params.side
+    assert params.neighbourhood != 'graph' or params.graph_file is not None
+    assert params.bucket_size >= 1
+    assert params.workers >= 1
+    # memory mapped and shared grids store types as int8
+    # and are processed in windows, which need a bounded lattice topology
+    assert (params.memmap_file is None and params.workers == 1) or \
+        (params.types <= 127 and params.tile_size > 0 and params.neighbourhood != 'graph' and not params.torus)
+    # history files store types as int8 too
+    assert params.history_file is None or params.types <= 127
 
 
 # get the neighbourhood_score of a cell
 def neighbourhood_score(node: Node, looking_for_type: int):
-    value = 0
-    nneighbours = 0
-    for i in range(-1, 2):
-        for j in range(-1, 2):
-            # index of the neighbour
-            neighbour = tuple(np.add(node, (i, j)))
-            # if the node is a valid node, it isn't the central node, and is not empty
-            if valid_node(neighbour) and (i, j) != (0, 0) and params.type_matrix[neighbour] != -1:
-                nneighbours += 1
-                value += params.gets_along_with[looking_for_type, params.type_matrix[neighbour]]
+    neighbour_types = params.type_matrix.reshape(-1)[topology.neighbours(node)]
+    # empty neighbours don't count
+    neighbour_types = neighbour_types[neighbour_types != -1]
     # if prevents division by 0
-    return value / nneighbours if nneighbours != 0 else 0
+    if len(neighbour_types) == 0:
+        return 0
+    return float(np.asarray(params.gets_along_with)[looking_for_type, neighbour_types].mean())
+
+
+# count, for every cell, how many of its (non empty) neighbours are of each type, using the
+# neighbour table of the topology. Returns an array of shape (types, side, side)
+def neighbour_type_counts(grid: np.ndarray):
+    neighbour_types = grid.reshape(-1)[params.neighbour_indices].astype(np.int64)
+    occupied = neighbour_types != -1
+    counts = np.bincount(params.neighbour_sources[occupied] * params.types + neighbour_types[occupied],
+                         minlength=params.side * params.side * params.types)
+    return counts.reshape((params.side, params.side, params.types)).transpose((2, 0, 1))
+
+
+# neighbour_type_counts of the inner cells of a window of the grid, which has an extra border of
+# neighbourhood_radius cells on every side that are only used as neighbours. Only for bounded
+# lattice topologies. Returns an array of shape (types, rows, cols)
+def window_neighbour_type_counts(window: np.ndarray):
+    halo = params.neighbourhood_radius
+    rows, cols = window.shape[0] - 2 * halo, window.shape[1] - 2 * halo
+    # one layer per type
+    layers = (window[None] == np.arange(params.types)[:, None, None]).astype(np.int32)
+    counts = np.zeros((params.types, rows, cols), dtype=np.int32)
+    for i, j in topology.lattice_offsets():
+        counts += layers[:, halo + i:rows + halo + i, halo + j:cols + halo + j]
+    return counts
+
+
+# vectorized neighbourhood_score of every cell, for every type it could be looking for
+# [t, i, j] is neighbourhood_score((i, j), t)
+def neighbourhood_scores(counts: np.ndarray):
+    nneighbours = counts.sum(axis=0)
+    value = np.tensordot(np.asarray(params.gets_along_with, dtype=float), counts, axes=1)
+    # cells without neighbours score 0, like in neighbourhood_score
+    return np.divide(value, nneighbours, out=np.zeros_like(value), where=nneighbours != 0)
+
+
+# mask of the nodes whose score for their own type is below neighbour_amount
+def unstable_mask(grid: np.ndarray, scores: np.ndarray):
+    occupied = grid != -1
+    own_score = np.take_along_axis(scores, np.where(occupied, grid, 0)[None], axis=0)[0]
+    return occupied & (own_score < params.neighbour_amount)
+
+
+# nodes whose score for their own type is below neighbour_amount, in the order of iter_positions
+def unstable_nodes(grid: np.ndarray, scores: np.ndarray):
+    return [tuple(node) for node in np.argwhere(unstable_mask(grid, scores)).tolist()]
 
 
 # initialze the grid
 def initialize_grid_graph():
-    all_positions = list(iter_positions())
-    # randomly choose empty nodes
-
-    _empty_nodes = random.sample(all_positions,
-                                 int(params.side * params.side * params.empty_fraction))
-    # set empty nodes type
-    for node in _empty_nodes:
-        params.type_matrix[node] = -1
-
-    # number of non-empty nodes
-    typeable_nodes = params.side * params.side - len(_empty_nodes)
-    # set of nodes available to assign to a type
-    available_nodes = set(all_positions).difference(_empty_nodes)
-    for i in range(params.types - 1):
-        # randomly choose the requisite number of nodes
-        type_nodes = random.sample(available_nodes, int(
-            typeable_nodes * params.types_distribution[i]))
-        # assign the type
-        for node in type_nodes:
-            params.type_matrix[node] = i
-        # remove the used nodes from the set of nodes available to assign to other types
-        available_nodes = available_nodes.difference(type_nodes)
-
-    # last type isn't in the for loop so all the rest get assigned
-    for node in available_nodes:
-        params.type_matrix[node] = params.types - 1
-
-
-# initialize the empty_map variable
+    nodes = params.side * params.side
+    # number of empty nodes, then of nodes of every type
+    nempty = int(nodes * params.empty_fraction)
+    typeable_nodes = nodes - nempty
+    counts = [int(typeable_nodes * params.types_distribution[i]) for i in range(params.types - 1)]
+    # last type gets all the rest
+    counts.append(typeable_nodes - sum(counts))
+
+    # one random permutation of all nodes, split into consecutive runs for empty nodes and each type
+    labels = np.repeat(np.arange(-1, params.types), [nempty] + counts)
+    params.type_matrix = np.empty((params.side, params.side), dtype=int)
+    params.type_matrix.reshape(-1)[np.random.permutation(nodes)] = labels
+
+
+# set of the empty nodes of the grid
+def empty_node_set():
+    return set(map(tuple, np.argwhere(params.type_matrix == -1).tolist()))
+
+
+# random seed for Zobrist hashing. The bitstring of every (node, type) pair is derived from it
+def initialize_zobrist():
+    params.zobrist_seed = int(np.random.randint(np.iinfo(np.uint64).max, dtype=np.uint64))
+    params.grid_hash = grid_hash(params.type_matrix)
+
+
+# Zobrist bitstrings of (node, type) pairs, given as flat node indices and types (-1 for empty)
+# computed with the splitmix64 mixer instead of stored, so no table of every pair is needed
+def zobrist_bitstrings(nodes: np.ndarray, types: np.ndarray):
+    with np.errstate(over='ignore'):
+        z = (np.asarray(nodes, dtype=np.uint64) * np.uint64(params.types + 1) +
+             np.asarray(types + 1, dtype=np.uint64)) ^ np.uint64(params.zobrist_seed)
+        z = z + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+# Zobrist hash of a grid, the xor of the bitstrings of the type of every node
+def grid_hash(grid: np.ndarray):
+    bitstrings = zobrist_bitstrings(np.arange(grid.size), grid.reshape(-1))
+    return int(np.bitwise_xor.reduce(bitstrings))
+
+
+# update params.grid_hash incrementally for a node of type node_type moving from node to empty
+def update_grid_hash(node: Node, empty: Node, node_type: int):
+    node_index = node[0] * params.side + node[1]
+    empty_index = empty[0] * params.side + empty[1]
+    # node changes from node_type to empty, and empty from empty to node_type
+    bitstrings = zobrist_bitstrings(np.array([node_index, node_index, empty_index, empty_index]),
+                                    np.array([node_type, -1, -1, node_type]))
+    params.grid_hash ^= int(np.bitwise_xor.reduce(bitstrings))
+
+
+# initialize the empty_map variable, with the vectorized scores of every empty node
 def initialize_empty_map():
-    params.empty_map = {enode: {i: neighbourhood_score(enode, i)
-                                for i in range(params.types)} for enode in params.empty_nodes}
+    scores = neighbourhood_scores(neighbour_type_counts(params.type_matrix))
+    rows, cols = np.nonzero(params.type_matrix == -1)
+    params.empty_map = {node: dict(enumerate(node_scores)) for node, node_scores in
+                        zip(zip(rows.tolist(), cols.tolist()), scores[:, rows, cols].T.tolist())}
     return params.empty_map
 
 
@@ -107,11 +183,6 @@ def show_grid():
 
 # generates a colour map for plotting
 def get_colour_map(grid: np.ndarray):
-    colour_map = np.ndarray((params.side, params.side, 3), dtype=float)
-    for i in range(params.side):
-        for j in range(params.side):
-            if grid[(i, j)] == -1:
-                colour_map[(i, j)] = params.empty_colour
-            else:
-                colour_map[(i, j)] = params.type_colours[grid[(i, j)]]
-    return colour_map
+    # colour of every value of the grid, offset by one so that empty nodes are row 0
+    colours = np.array([params.empty_colour] + list(params.type_colours), dtype=float)
+    return colours[np.asarray(grid, dtype=np.intp) + 1]